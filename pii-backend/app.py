@@ -1,13 +1,24 @@
 # app.py
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import threading
 import tempfile
 import os
+import json
 import shutil
-from typing import List
+from typing import List, Optional, Tuple
 
 # Import your finalized engine
-from pii_engine import run_pii_extraction
+from pii_engine import run_pii_extraction, iter_pii_extraction, InMemoryFile
+import job_queue
+from result_cache import get_default_cache
+from result_table import EXPORT_FORMATS, ExportUnavailableError, check_format, flat_row, iter_export
+import metrics
 
 app = FastAPI(title="PII Extraction API")
 
@@ -20,37 +31,370 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/extract")
-async def extract_pii(files: List[UploadFile] = File(...)):
-   
-    # Create a unique temporary directory for this specific request
-    temp_dir = tempfile.mkdtemp()
+# EXTRACTION EXECUTOR
+# Extraction is CPU-bound, so it runs in a bounded pool off the event loop.
+# PII_MAX_CONCURRENT requests run at once, up to PII_MAX_QUEUED more wait for
+# a slot, and anything beyond that is rejected with 503 + Retry-After.
+
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("PII_MAX_CONCURRENT", "2"))
+MAX_QUEUED_EXTRACTIONS = int(os.getenv("PII_MAX_QUEUED", "8"))
+EXECUTOR_KIND = os.getenv("PII_EXECUTOR", "process")  # "process" or "thread"
+RETRY_AFTER_SECONDS = 5
+# Lets clients send "X-PII-Profile: 1" to get a cProfile report for their
+# request. Off by default: a profiled run is sequential and slower.
+PROFILING_ALLOWED = os.getenv("PII_ALLOW_PROFILING", "0") == "1"
+# Uploads up to this size are extracted straight from memory; larger ones are
+# spooled to a temp dir first. 0 spools everything.
+UPLOAD_MEMORY_BYTES = int(float(os.getenv("PII_UPLOAD_MEMORY_MB", "8")) * 1024 * 1024)
+
+
+class AdmissionLimiter:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+limiter = AdmissionLimiter(MAX_CONCURRENT_EXTRACTIONS + MAX_QUEUED_EXTRACTIONS)
+stream_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXTRACTIONS)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if EXECUTOR_KIND == "thread":
+                _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_EXTRACTIONS)
+            else:
+                _executor = ProcessPoolExecutor(max_workers=MAX_CONCURRENT_EXTRACTIONS)
+        return _executor
+
+
+def discard_executor(broken):
+    # the next get_executor() starts a fresh pool; other requests may have
+    # replaced this one already
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_extraction(*args):
+    # run_pii_extraction(*args) in the executor. A worker that dies (killed
+    # for memory on a huge PDF, say) breaks the whole process pool and every
+    # request on it: the pool is replaced and the request retried once, then
+    # answered with 503.
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = get_executor()
+        try:
+            return await loop.run_in_executor(executor, run_pii_extraction, *args)
+        except BrokenProcessPool:
+            discard_executor(executor)
+    raise HTTPException(
+        status_code=503,
+        detail="Extraction worker crashed, retry later",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def admit_request():
+    if not limiter.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# JOB API
+# Large batches go through the persistent queue in job_queue.py instead of
+# holding a request open: submit, poll /jobs/{id}, then fetch the results.
+
+job_store = None
+_job_workers = None
+
+
+@app.on_event("startup")
+def start_job_workers():
+    global job_store, _job_workers
+    job_store = job_queue.JobStore()
+    job_store.recover()
+    if job_queue.JOB_WORKERS > 0:
+        _job_workers = job_queue.start_workers(job_store.db_path)
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    if _job_workers is not None:
+        processes, stop_event = _job_workers
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=10)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "in_flight": limiter.in_flight,
+        "capacity": limiter.capacity,
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Totals of every finished /extract and /extract/stream request in this
+    # server process (job queue workers are separate processes and not
+    # included), in Prometheus text format.
+    text = metrics.render_prometheus(gauges={
+        "in_flight_requests": limiter.in_flight,
+        "request_capacity": limiter.capacity,
+    })
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+def record_request(stage_metrics):
+    metrics.record(stage_metrics)
+    metrics.record({"counters": {"requests": 1}})
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    cache = get_default_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+def save_uploads(files: List[UploadFile], temp_dir: str) -> List[str]:
     file_paths = []
+    for file in files:
+        # Preserve original filename for engine metadata
+        file_path = os.path.join(temp_dir, os.path.basename(file.filename))
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        file_paths.append(file_path)
+    return file_paths
 
+
+def read_uploads(files: List[UploadFile]) -> Tuple[list, Optional[str]]:
+    # (sources, temp_dir): an InMemoryFile per small upload, a path per large
+    # one. temp_dir is only created when something had to be spooled.
+    sources, temp_dir = [], None
     try:
         for file in files:
-            # Preserve original filename for engine metadata
-            file_path = os.path.join(temp_dir, file.filename)
+            name = os.path.basename(file.filename)
+            head = file.file.read(UPLOAD_MEMORY_BYTES + 1)
+            if UPLOAD_MEMORY_BYTES and len(head) <= UPLOAD_MEMORY_BYTES:
+                sources.append(InMemoryFile(name, head))
+                continue
+
+            if temp_dir is None:
+                temp_dir = tempfile.mkdtemp()
+            file_path = os.path.join(temp_dir, name)
             with open(file_path, "wb") as buffer:
+                buffer.write(head)
                 shutil.copyfileobj(file.file, buffer)
-            file_paths.append(file_path)
+            sources.append(file_path)
+    except Exception:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return sources, temp_dir
+
+
+@app.post("/extract")
+async def extract_pii(
+    files: List[UploadFile] = File(...),
+    metadata: bool = False,
+    x_pii_profile: bool = Header(False),
+):
+    # metadata=true adds per-stage timings and counters to the response;
+    # the X-PII-Profile header adds a cProfile report (PII_ALLOW_PROFILING)
+    if x_pii_profile and not PROFILING_ALLOWED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled on this server")
+    admit_request()
+    temp_dir = None
+
+    try:
+        sources, temp_dir = await run_in_threadpool(read_uploads, files)
 
-        # Call the engine. Note: run_pii_extraction handles lists perfectly.
-        # We pass the list of temporary paths.
-        results = run_pii_extraction(file_paths)
+        # metadata is always collected (it feeds /metrics), only returned on request
+        results = await run_extraction(sources, None, True, x_pii_profile, True)
+        if "metadata" in results:
+            record_request(results["metadata"])
 
-        return {
+        rows = [flat_row(row) for row in results.get("rows", [])]
+        response = {
             "status": results.get("status", "success"),
-            "count": len(results.get("rows", [])),
-            "rows": results.get("rows", [])
+            "count": len(rows),
+            "rows": rows
         }
+        if metadata and "metadata" in results:
+            response["metadata"] = results["metadata"]
+        if "profile" in results:
+            response["profile"] = results["profile"]
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
     finally:
-        # Crucial: Clean up the entire temp directory and its files
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        limiter.release()
+        if temp_dir is not None:
+            await run_in_threadpool(shutil.rmtree, temp_dir, True)
+
+@app.post("/extract/stream")
+async def extract_pii_stream(files: List[UploadFile] = File(...)):
+    # Same rows as /extract, one JSON object per line (NDJSON), sent as each
+    # page finishes. The generator runs on Starlette's thread pool and holds
+    # one of the PII_MAX_CONCURRENT slots while it produces rows.
+    admit_request()
+
+    try:
+        sources, temp_dir = await run_in_threadpool(read_uploads, files)
+    except Exception as e:
+        limiter.release()
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    stage_metrics = metrics.StageMetrics()
+
+    def ndjson_rows():
+        try:
+            with stream_slots:
+                for row in iter_pii_extraction(sources, stage_metrics=stage_metrics):
+                    yield json.dumps(flat_row(row)) + "\n"
+        finally:
+            # runs once the client has the last row or disconnects
+            record_request(stage_metrics)
+            limiter.release()
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return StreamingResponse(ndjson_rows(), media_type="application/x-ndjson")
+
+# DOWNLOADS
+# Results as a Parquet, Arrow IPC stream or CSV file, written batch by batch
+# while it is sent. PII fields are lists there instead of joined strings.
+
+def check_export_format(format: str):
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+
+def export_response(chunks, format: str, name: str) -> StreamingResponse:
+    media_type, ext = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        chunks, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}{ext}"'},
+    )
+
+
+@app.post("/extract/download")
+async def extract_pii_download(files: List[UploadFile] = File(...), format: str = "csv"):
+    # Same extraction as /extract, returned as a file. Rows travel back from
+    # the executor as a columnar ResultTable.
+    check_export_format(format)
+    admit_request()
+    temp_dir = None
+
+    try:
+        sources, temp_dir = await run_in_threadpool(read_uploads, files)
+        results = await run_extraction(sources, None, True, False, True)
+        if "metadata" in results:
+            record_request(results["metadata"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    finally:
+        limiter.release()
+        if temp_dir is not None:
+            await run_in_threadpool(shutil.rmtree, temp_dir, True)
+
+    return export_response(iter_export(results["rows"], format), format, "pii_results")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...)):
+    job_id = job_queue.new_job_id()
+    work_dir = os.path.join(job_queue.JOB_DIR, job_id)
+    os.makedirs(work_dir, exist_ok=True)
+
+    try:
+        file_paths = await run_in_threadpool(save_uploads, files, work_dir)
+        await run_in_threadpool(job_store.submit, file_paths, work_dir, job_id)
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    status = job_store.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, offset: int = 0, limit: int = 10000):
+    status = job_store.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status["status"] not in ("done", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+
+    rows = [flat_row(row) for row in job_store.rows(job_id, offset, limit)]
+    return {
+        "status": status["status"],
+        "total": status["progress"]["rows"],
+        "offset": offset,
+        "count": len(rows),
+        "rows": rows,
+    }
+
+
+@app.get("/jobs/{job_id}/download")
+def job_download(job_id: str, format: str = "csv"):
+    # every row of a finished job as one file, read from the job database a
+    # batch at a time
+    check_export_format(format)
+    status = job_store.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status["status"] not in ("done", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+
+    return export_response(iter_export(job_store.iter_rows(job_id), format), format, f"pii_job_{job_id}")
 
 if __name__ == "__main__":
     import uvicorn
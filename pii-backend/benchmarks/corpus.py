@@ -0,0 +1,224 @@
+# Synthetic benchmark corpus with seeded Indian PII.
+#
+#   cd pii-backend
+#   python -m benchmarks.corpus bench_corpus --seed 0 --xlsx-rows 5000
+#
+# Everything is generated locally (PyMuPDF, OpenCV, python-docx, openpyxl),
+# so it runs offline. The same seed always gives the same people and the
+# same files. manifest.json lists each file with the people seeded into it.
+
+import argparse
+import json
+import os
+import random
+import sys
+
+import cv2
+import fitz
+import numpy as np
+import openpyxl
+from docx import Document
+
+FIRST_NAMES = [
+    "Ravi", "Sita", "Arjun", "Priya", "Kiran", "Anita", "Vikram", "Meera",
+    "Rahul", "Deepa", "Suresh", "Kavya", "Amit", "Neha", "Rohan", "Lakshmi",
+]
+LAST_NAMES = [
+    "Kumar", "Sharma", "Mehta", "Rao", "Iyer", "Patel", "Reddy", "Singh",
+    "Nair", "Das", "Gupta", "Joshi", "Menon", "Verma", "Pillai", "Bose",
+]
+CITIES = [
+    ("Bengaluru", "Karnataka"), ("Mumbai", "Maharashtra"), ("Kolkata", "West Bengal"),
+    ("Chennai", "Tamil Nadu"), ("Jaipur", "Rajasthan"), ("Lucknow", "Uttar Pradesh"),
+    ("Kochi", "Kerala"), ("Panaji", "Goa"),
+]
+STREETS = ["MG Road", "Park Street", "Station Road", "Temple Lane", "Lake View Road"]
+FILLER = (
+    "the committee reviewed the quarterly figures and noted that several branches "
+    "reported delays in processing customer requests while the regional office "
+    "prepared revised guidance for staff on record keeping and data handling"
+).split()
+
+
+def make_person(rng):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    city, state = rng.choice(CITIES)
+    return {
+        "name": f"{first} {last}",
+        "pan": "".join(rng.choice(letters) for _ in range(5)) + f"{rng.randrange(10000):04d}" + rng.choice(letters),
+        "aadhaar": f"{rng.randint(2, 9)}{rng.randrange(1000):03d} {rng.randrange(10000):04d} {rng.randrange(10000):04d}",
+        "phone": f"{rng.randint(6, 9)}{rng.randrange(10 ** 9):09d}",
+        "email": f"{first.lower()}.{last.lower()}{rng.randrange(100)}@example.com",
+        "dob": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2004)}",
+        "address": f"{rng.randint(1, 200)} {rng.choice(STREETS)}, {city}",
+        "state_pin": f"{state} {rng.randint(110000, 855000)}",
+    }
+
+
+def filler_sentence(rng):
+    return " ".join(rng.choice(FILLER) for _ in range(rng.randint(12, 30))).capitalize() + "."
+
+
+def person_form(p):
+    return [
+        f"Name: {p['name']}",
+        f"PAN: {p['pan']}",
+        f"Aadhaar: {p['aadhaar']}",
+        f"Mobile: {p['phone']}",
+        f"Email: {p['email']}",
+        f"DOB: {p['dob']}",
+        f"Address: {p['address']}",
+        p["state_pin"],
+    ]
+
+
+def narrative_page(rng, people):
+    # report prose with a KYC block for each person on the page
+    lines = [f"Branch review report, reference {rng.randrange(10 ** 6):06d}"]
+    for idx, p in enumerate(people, start=1):
+        lines += [filler_sentence(rng) for _ in range(rng.randint(2, 5))]
+        lines.append(f"Applicant {idx}")
+        lines += person_form(p)
+    lines += [filler_sentence(rng) for _ in range(rng.randint(2, 6))]
+    return "\n".join(lines)
+
+
+def write_narrative_pdf(path, rng, pages, people_per_page):
+    seeded = []
+    doc = fitz.open()
+    for _ in range(pages):
+        people = [make_person(rng) for _ in range(people_per_page)]
+        seeded += people
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), narrative_page(rng, people), fontsize=9)
+    doc.save(path)
+    doc.close()
+    return seeded
+
+
+def write_scanned_pdf(path, rng, pages, dpi=200):
+    # text pages rasterized and re-embedded as images: no text layer
+    seeded = []
+    out = fitz.open()
+    for _ in range(pages):
+        p = make_person(rng)
+        seeded.append(p)
+        src = fitz.open()
+        page = src.new_page()
+        page.insert_textbox(fitz.Rect(60, 60, page.rect.width - 60, page.rect.height - 60), "\n".join(person_form(p)), fontsize=12)
+        pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), colorspace=fitz.csGRAY)
+        scan = out.new_page(width=page.rect.width, height=page.rect.height)
+        scan.insert_image(scan.rect, stream=pix.tobytes("png"))
+        src.close()
+    out.save(path)
+    out.close()
+    return seeded
+
+
+def write_card_image(path, rng):
+    # a card photographed on a textured background, slightly rotated
+    p = make_person(rng)
+    card = np.full((540, 860, 3), 245, np.uint8)
+    cv2.rectangle(card, (0, 0), (859, 70), (60, 90, 160), -1)
+    cv2.putText(card, "INCOME TAX DEPARTMENT", (150, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+    cv2.rectangle(card, (40, 110), (240, 360), (90, 90, 90), -1)
+    for i, line in enumerate([p["name"], f"DOB: {p['dob']}", "Permanent Account Number", p["pan"]]):
+        cv2.putText(card, line, (280, 150 + 55 * i), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (20, 20, 20), 2)
+    cv2.putText(card, p["aadhaar"], (250, 470), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (10, 10, 10), 4)
+
+    noise = np.random.default_rng(rng.randrange(2 ** 32)).normal(110, 25, (1800, 2400, 3))
+    photo = cv2.GaussianBlur(noise.clip(0, 255).astype(np.uint8), (9, 9), 0)
+    m = cv2.getRotationMatrix2D((430, 270), rng.uniform(-8, 8), 1.6)
+    m[:, 2] += (rng.randint(500, 800), rng.randint(450, 650))
+    mask = cv2.warpAffine(np.full(card.shape[:2], 255, np.uint8), m, (2400, 1800))
+    warped = cv2.warpAffine(card, m, (2400, 1800))
+    photo[mask > 0] = warped[mask > 0]
+    cv2.imwrite(path, photo, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return [p]
+
+
+def write_docx(path, rng, people):
+    seeded = [make_person(rng) for _ in range(people)]
+    doc = Document()
+    doc.add_paragraph(filler_sentence(rng))
+    for idx, p in enumerate(seeded, start=1):
+        doc.add_paragraph(f"Applicant {idx}")
+        for line in person_form(p):
+            doc.add_paragraph(line)
+        doc.add_paragraph(filler_sentence(rng))
+    table = doc.add_table(rows=len(seeded) + 1, cols=3)
+    for col, title in enumerate(["Name", "PAN", "Mobile"]):
+        table.cell(0, col).text = title
+    for row, p in enumerate(seeded, start=1):
+        table.cell(row, 0).text = p["name"]
+        table.cell(row, 1).text = p["pan"]
+        table.cell(row, 2).text = p["phone"]
+    doc.save(path)
+    return seeded
+
+
+def write_xlsx(path, rng, rows):
+    seeded = []
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Customers")
+    ws.append(["Customer Name", "PAN", "Aadhaar", "Mobile", "Email", "DOB", "Address", "Branch"])
+    for _ in range(rows):
+        p = make_person(rng)
+        seeded.append(p)
+        ws.append([p["name"], p["pan"], p["aadhaar"], int(p["phone"]), p["email"], p["dob"],
+                   f"{p['address']} {p['state_pin']}", rng.choice(CITIES)[0]])
+    wb.save(path)
+    return seeded
+
+
+def generate(out_dir, seed=0, pdf_pages=20, people_per_page=2, scanned_pages=5,
+             cards=5, docx_files=3, docx_people=10, xlsx_rows=5000):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    files = {}
+
+    def add(name, kind, people, **extra):
+        files[name] = {"kind": kind, "people": len(people), **extra}
+        return people
+
+    if pdf_pages:
+        add("narrative.pdf", "pdf", write_narrative_pdf(os.path.join(out_dir, "narrative.pdf"), rng, pdf_pages, people_per_page), pages=pdf_pages)
+    if scanned_pages:
+        add("scanned.pdf", "scanned_pdf", write_scanned_pdf(os.path.join(out_dir, "scanned.pdf"), rng, scanned_pages), pages=scanned_pages)
+    for i in range(cards):
+        add(f"card_{i}.jpg", "card_image", write_card_image(os.path.join(out_dir, f"card_{i}.jpg"), rng), pages=1)
+    for i in range(docx_files):
+        add(f"form_{i}.docx", "docx", write_docx(os.path.join(out_dir, f"form_{i}.docx"), rng, docx_people), pages=1)
+    if xlsx_rows:
+        add("customers.xlsx", "xlsx", write_xlsx(os.path.join(out_dir, "customers.xlsx"), rng, xlsx_rows), rows=xlsx_rows)
+
+    manifest = {"seed": seed, "files": files}
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PII benchmark corpus")
+    parser.add_argument("out_dir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-pages", type=int, default=20, help="pages of the narrative (text layer) PDF")
+    parser.add_argument("--people-per-page", type=int, default=2)
+    parser.add_argument("--scanned-pages", type=int, default=5, help="pages of the image-only PDF")
+    parser.add_argument("--cards", type=int, default=5, help="ID card photos")
+    parser.add_argument("--docx", type=int, default=3, help="DOCX files")
+    parser.add_argument("--docx-people", type=int, default=10, help="people per DOCX file")
+    parser.add_argument("--xlsx-rows", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    manifest = generate(
+        args.out_dir, args.seed, args.pdf_pages, args.people_per_page, args.scanned_pages,
+        args.cards, args.docx, args.docx_people, args.xlsx_rows,
+    )
+    print(json.dumps(manifest, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# Compare OCR backends on sample scans.
+#
+#   cd pii-backend
+#   python -m benchmarks.ocr_backends scans/*.png scans/*.pdf --repeat 3
+#
+# Images are OCR'd whole; PDFs are rasterized page by page exactly as
+# process_document does for pages without a text layer. Every backend sees
+# the same preprocessed images, so only the OCR call itself is timed.
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import cv2
+import fitz
+
+import pii_engine
+
+BACKENDS = ("pytesseract", "tesserocr")
+
+
+def load_images(paths):
+    images = []
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            with fitz.open(path) as doc:
+                for page in doc:
+                    image, pix = pii_engine.render_page_gray(page)
+                    images.append((f"{path}#{page.number + 1}", pii_engine.production_preprocess(image)))
+        else:
+            images.append((path, pii_engine.production_preprocess(cv2.imread(path))))
+    return images
+
+
+def bench_backend(name, images, repeat):
+    try:
+        backend = pii_engine.create_ocr_backend(name)
+        # first call pays for engine start-up (and language data for tesserocr)
+        t0 = time.perf_counter()
+        backend.image_to_string(images[0][1])
+        warmup = time.perf_counter() - t0
+    except Exception as e:
+        return {"available": False, "error": str(e)}
+
+    latencies = []
+    chars = 0
+    for _ in range(repeat):
+        for _, image in images:
+            t0 = time.perf_counter()
+            chars += len(backend.image_to_string(image))
+            latencies.append(time.perf_counter() - t0)
+
+    latencies.sort()
+    return {
+        "available": True,
+        "first_call_s": warmup,
+        "pages": len(latencies),
+        "total_s": sum(latencies),
+        "mean_s": statistics.mean(latencies),
+        "p50_s": latencies[len(latencies) // 2],
+        "p99_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "pages_per_s": len(latencies) / sum(latencies),
+        "chars": chars,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OCR backends on sample scans")
+    parser.add_argument("paths", nargs="+", help="images or scanned PDFs")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--backend", action="append", choices=BACKENDS, help="default: all")
+    args = parser.parse_args(argv)
+
+    images = load_images(args.paths)
+    if not images:
+        print("no pages to OCR", file=sys.stderr)
+        return 1
+
+    report = {
+        name: bench_backend(name, images, args.repeat)
+        for name in (args.backend or BACKENDS)
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# End-to-end and per-stage extraction benchmark.
+#
+#   cd pii-backend
+#   python -m benchmarks.corpus bench_corpus
+#   python -m benchmarks.pipeline bench_corpus --output before.json
+#   ... change something ...
+#   python -m benchmarks.pipeline bench_corpus --baseline before.json --max-regression 0.10
+#
+# Two passes over the corpus, both with the result cache off:
+#  - stages: every page / spreadsheet chunk goes through the engine's
+#    building blocks one at a time, so each stage gets its own latency
+#    distribution (read, ocr, extract for documents; excel_read,
+#    excel_extract for spreadsheets)
+#  - end_to_end: run_pii_extraction over the documents and over the
+#    spreadsheets, which is what the API does, batching included
+#
+# Each pass starts with an empty OCR memo (duplicate images), so the second
+# pass does not get the first pass's OCR for free.
+#
+# Prints a JSON report. With --baseline, it also compares throughput and
+# stage latencies against an earlier report and exits with status 1 when
+# anything is worse than --max-regression allows.
+
+import os
+
+# results must be computed, not served from an earlier run
+os.environ["PII_CACHE_MAX_MB"] = "0"
+
+import argparse
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+
+import pii_engine
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(samples):
+    return {
+        "calls": len(samples),
+        "total_s": sum(samples),
+        "p50_s": percentile(samples, 0.50),
+        "p99_s": percentile(samples, 0.99),
+        "per_s": len(samples) / sum(samples) if sum(samples) else None,
+    }
+
+
+def bench_stages(files):
+    pii_engine.clear_ocr_memo()
+    stages = defaultdict(list)
+    for path in files:
+        dtype = pii_engine.identify_file(path)
+        filename = os.path.basename(path)
+
+        if dtype == pii_engine.DocType.EXCEL:
+            t0 = time.perf_counter()
+            for sheet_name, df, column_kinds in pii_engine.iter_excel_tasks(path):
+                stages["excel_read"].append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                pii_engine.extract_excel_chunk(filename, sheet_name, df, column_kinds)
+                stages["excel_extract"].append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+            continue
+
+        t0 = time.perf_counter()
+        for page_no, text in pii_engine.iter_pages(path, dtype, ocr=False):
+            stages["read"].append(time.perf_counter() - t0)
+            if text is None:
+                t0 = time.perf_counter()
+                text = pii_engine.ocr_page(path, dtype, page_no)
+                stages["ocr"].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            pii_engine.extract_pages_batch(filename, [(page_no, text)])
+            stages["extract"].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+
+    return {name: summarize(samples) for name, samples in sorted(stages.items())}
+
+
+def bench_end_to_end(files, workers, count_pages=True):
+    if not files:
+        return None
+    pii_engine.clear_ocr_memo()
+    t0 = time.perf_counter()
+    result = pii_engine.run_pii_extraction(files, workers=workers, metadata=True)
+    seconds = time.perf_counter() - t0
+    # pages as the engine reports them: a DOCX has one per chunk, which is
+    # only known once it has been read
+    pages = result["metadata"]["counters"].get("pages") if count_pages else None
+    rows = len(result.get("rows", []))
+    return {
+        "files": len(files),
+        "pages": pages,
+        "rows": rows,
+        "seconds": seconds,
+        "pages_per_s": pages / seconds if pages is not None else None,
+        "rows_per_s": rows / seconds,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; children covers PII_WORKERS processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"self": own / 1024, "children": children / 1024}
+
+
+# (path in the report, True when bigger is better)
+COMPARED_METRICS = [
+    (("end_to_end", "documents", "pages_per_s"), True),
+    (("end_to_end", "documents", "rows_per_s"), True),
+    (("end_to_end", "spreadsheets", "rows_per_s"), True),
+]
+for _stage in ("read", "ocr", "extract", "excel_read", "excel_extract"):
+    COMPARED_METRICS += [(("stages", _stage, "p50_s"), False), (("stages", _stage, "p99_s"), False)]
+
+
+def lookup(report, path):
+    for key in path:
+        if not isinstance(report, dict) or report.get(key) is None:
+            return None
+        report = report[key]
+    return report
+
+
+def compare(report, baseline, max_regression):
+    # change > 0 always means "got worse"
+    comparison, regressions = {}, []
+    for path, higher_is_better in COMPARED_METRICS:
+        old, new = lookup(baseline, path), lookup(report, path)
+        if not old or new is None:
+            continue
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        name = ".".join(path)
+        comparison[name] = {"baseline": old, "current": new, "worse_by": change}
+        if max_regression is not None and change > max_regression:
+            regressions.append(name)
+    return comparison, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PII extraction on a corpus directory")
+    parser.add_argument("corpus", help="directory, e.g. one made by benchmarks.corpus")
+    parser.add_argument("--workers", type=int, default=1, help="workers for the end-to-end pass (0 = all cores)")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--output", help="also write the report here")
+    parser.add_argument("--baseline", help="earlier report to compare with")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="fail when a metric is worse than the baseline by more than this fraction")
+    args = parser.parse_args(argv)
+
+    files = sorted(pii_engine.collect_files(args.corpus))
+    if not files:
+        print("no supported files in corpus", file=sys.stderr)
+        return 1
+
+    # model load is start-up cost, not extraction
+    t0 = time.perf_counter()
+    pii_engine.preload_model()
+    model_load_s = time.perf_counter() - t0
+
+    documents = [f for f in files if pii_engine.identify_file(f) != pii_engine.DocType.EXCEL]
+    spreadsheets = [f for f in files if f not in documents]
+
+    report = {
+        "engine_version": pii_engine.ENGINE_VERSION,
+        "ocr_backend": pii_engine.get_ocr_backend().name,
+        "spacy_model": pii_engine.SPACY_MODEL,
+        "excel_engine": pii_engine.EXCEL_ENGINE,
+        "corpus": os.path.abspath(args.corpus),
+        "model_load_s": model_load_s,
+        "stages": None if args.skip_stages else bench_stages(files),
+        "end_to_end": {
+            "workers": args.workers,
+            "documents": bench_end_to_end(documents, args.workers),
+            # spreadsheet size is reported as output rows only
+            "spreadsheets": bench_end_to_end(spreadsheets, args.workers, count_pages=False),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison, regressions = compare(report, json.load(f), args.max_regression)
+        report["comparison"] = comparison
+        report["regressions"] = regressions
+        status = 1 if regressions else 0
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# Startup-time benchmark for the extraction engine.
+#
+#   cd pii-backend
+#   python -m benchmarks.startup --runs 5 --max-import-seconds 1.0
+#
+# Each run starts a fresh interpreter, so module caches from earlier runs do
+# not hide regressions. Exits with status 1 when a limit is exceeded.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import pii_engine
+t1 = time.perf_counter()
+out = {"import_s": t1 - t0}
+if LOAD_MODEL:
+    pii_engine.get_nlp()
+    out["model_load_s"] = time.perf_counter() - t1
+    out["pipeline"] = pii_engine.get_nlp().pipe_names
+print(json.dumps(out))
+"""
+
+
+def run_probe(load_model: bool) -> dict:
+    code = PROBE.replace("LOAD_MODEL", repr(load_model))
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure pii_engine import and model load time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-model", action="store_true", help="only measure the import")
+    parser.add_argument("--max-import-seconds", type=float, default=None)
+    parser.add_argument("--max-model-seconds", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    samples = [run_probe(not args.skip_model) for _ in range(args.runs)]
+
+    report = {"runs": args.runs, "import_s": summarize([s["import_s"] for s in samples])}
+    if not args.skip_model:
+        report["model_load_s"] = summarize([s["model_load_s"] for s in samples])
+        report["pipeline"] = samples[-1]["pipeline"]
+
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if args.max_import_seconds is not None and report["import_s"]["median"] > args.max_import_seconds:
+        print(f"import time regression: {report['import_s']['median']:.3f}s > {args.max_import_seconds}s", file=sys.stderr)
+        failed = True
+    if args.max_model_seconds is not None and "model_load_s" in report and report["model_load_s"]["median"] > args.max_model_seconds:
+        print(f"model load regression: {report['model_load_s']['median']:.3f}s > {args.max_model_seconds}s", file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+# job_queue.py
+# Persistent job queue for large batches. Jobs, their files and result rows
+# live in one SQLite database, so queued and half-finished jobs survive a
+# server restart. Worker processes claim queued jobs and run each file through
+# pii_engine.iter_document_pages, recording progress per page.
+#
+# A claimed job holds a lease that its worker renews from a background thread
+# every JOB_LEASE_SECONDS / 4. When a worker dies, its lease runs out and the
+# next claim() takes the job over; the server process also restarts dead
+# workers (start_workers).
+
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+from typing import Dict, List, Optional
+
+import pii_engine
+
+JOB_DIR = os.getenv("PII_JOB_DIR", os.path.join(os.getcwd(), "pii_jobs"))
+JOB_DB_PATH = os.getenv("PII_JOB_DB", os.path.join(JOB_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("PII_JOB_WORKERS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("PII_JOB_LEASE_SECONDS", "60"))
+POLL_SECONDS = 1.0
+SUPERVISE_SECONDS = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    work_dir TEXT NOT NULL,
+    error TEXT,
+    worker TEXT,
+    lease_until REAL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    file_idx INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    total_pages INTEGER,
+    done_pages INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, file_idx)
+);
+CREATE TABLE IF NOT EXISTS job_rows (
+    job_id TEXT NOT NULL,
+    file_idx INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    row TEXT NOT NULL,
+    PRIMARY KEY (job_id, file_idx, seq)
+);
+"""
+
+# job status: queued -> running -> done | failed
+# file status: pending -> done | failed
+# jobs.worker / lease_until: who runs a running job, and until when it counts
+# as alive
+
+# columns added after the first release, for databases created before them
+MIGRATIONS = [
+    ("jobs", "worker", "TEXT"),
+    ("jobs", "lease_until", "REAL"),
+]
+
+
+class LeaseLostError(RuntimeError):
+    pass
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+class JobStore:
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            for table, column, kind in MIGRATIONS:
+                if column not in [r["name"] for r in conn.execute(f"PRAGMA table_info({table})")]:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def connect(self) -> sqlite3.Connection:
+        # one short-lived connection per call; safe across threads and processes
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, file_paths: List[str], work_dir: str, job_id: Optional[str] = None) -> str:
+        job_id = job_id or new_job_id()
+
+        # Counting pages opens every file, so it happens before the write
+        # lock is taken; workers recording progress must not wait on it.
+        files = []
+        for file_idx, path in enumerate(file_paths):
+            try:
+                total = pii_engine.count_pages(path)
+            except Exception:
+                total = None
+            files.append((job_id, file_idx, path, total))
+
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at, work_dir) VALUES (?, 'queued', ?, ?)",
+                (job_id, time.time(), work_dir),
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, file_idx, path, total_pages) VALUES (?, ?, ?, ?)",
+                files,
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def recover(self):
+        # Called at startup: running jobs whose worker stopped renewing the
+        # lease go back to the queue. Finished files are kept. (claim() takes
+        # these over as well; this makes /jobs/{id} say so right away.)
+        with closing(self.connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (time.time(),),
+            )
+
+    def claim(self, worker: str) -> Optional[str]:
+        # the oldest queued job, or a running one whose lease has expired
+        now = time.time()
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND (lease_until IS NULL OR lease_until < ?)) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), worker = ?, "
+                "lease_until = ? WHERE id = ?",
+                (now, worker, now + JOB_LEASE_SECONDS, row["id"]),
+            )
+            conn.execute("COMMIT")
+            return row["id"]
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        # False once another worker has taken the job over
+        with closing(self.connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job_id, worker),
+            )
+            return cur.rowcount == 1
+
+    def pending_files(self, job_id: str) -> List[sqlite3.Row]:
+        with closing(self.connect()) as conn:
+            return conn.execute(
+                "SELECT file_idx, path FROM job_files WHERE job_id = ? AND status = 'pending' ORDER BY file_idx",
+                (job_id,),
+            ).fetchall()
+
+    def reset_file(self, job_id: str, file_idx: int):
+        # drop whatever an interrupted run left behind for this file
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM job_rows WHERE job_id = ? AND file_idx = ?", (job_id, file_idx))
+            conn.execute(
+                "UPDATE job_files SET done_pages = 0, error = NULL WHERE job_id = ? AND file_idx = ?",
+                (job_id, file_idx),
+            )
+            conn.execute("COMMIT")
+
+    def add_page(self, job_id: str, file_idx: int, first_seq: int, pages_done: int, rows: List[Dict]):
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO job_rows (job_id, file_idx, seq, row) VALUES (?, ?, ?, ?)",
+                [(job_id, file_idx, first_seq + i, json.dumps(r)) for i, r in enumerate(rows)],
+            )
+            conn.execute(
+                "UPDATE job_files SET done_pages = done_pages + ? WHERE job_id = ? AND file_idx = ?",
+                (pages_done, job_id, file_idx),
+            )
+            conn.execute("COMMIT")
+
+    def finish_file(self, job_id: str, file_idx: int, error: Optional[str] = None):
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if error is not None:
+                # same as run_pii_extraction: a failed file contributes no rows
+                conn.execute("DELETE FROM job_rows WHERE job_id = ? AND file_idx = ?", (job_id, file_idx))
+            conn.execute(
+                "UPDATE job_files SET status = ?, error = ? WHERE job_id = ? AND file_idx = ?",
+                ("failed" if error is not None else "done", error, job_id, file_idx),
+            )
+            conn.execute("COMMIT")
+
+    def finish_job(self, job_id: str, error: Optional[str] = None, worker: Optional[str] = None) -> bool:
+        # with a worker: only if that worker still holds the job
+        with closing(self.connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ?, lease_until = NULL "
+                "WHERE id = ? AND (? IS NULL OR worker = ?)",
+                ("failed" if error is not None else "done", time.time(), error, job_id, worker, worker),
+            )
+            return cur.rowcount == 1
+
+    def work_dir(self, job_id: str) -> str:
+        with closing(self.connect()) as conn:
+            return conn.execute("SELECT work_dir FROM jobs WHERE id = ?", (job_id,)).fetchone()["work_dir"]
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with closing(self.connect()) as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = conn.execute(
+                "SELECT status, total_pages, done_pages FROM job_files WHERE job_id = ?",
+                (job_id,),
+            ).fetchall()
+            row_count = conn.execute(
+                "SELECT COUNT(*) FROM job_rows WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+
+        totals = [f["total_pages"] for f in files]
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "progress": {
+                "total_files": len(files),
+                "done_files": sum(1 for f in files if f["status"] != "pending"),
+                "failed_files": sum(1 for f in files if f["status"] == "failed"),
+                "total_pages": sum(totals) if all(t is not None for t in totals) else None,
+                "done_pages": sum(f["done_pages"] for f in files),
+                "rows": row_count,
+            },
+        }
+
+    def rows(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        with closing(self.connect()) as conn:
+            cur = conn.execute(
+                "SELECT row FROM job_rows WHERE job_id = ? ORDER BY file_idx, seq LIMIT ? OFFSET ?",
+                (job_id, -1 if limit is None else limit, offset),
+            )
+            return [json.loads(r["row"]) for r in cur]
+
+    def iter_rows(self, job_id: str, batch: int = 10000):
+        # every row of a job, read batch by batch (for exports of any size)
+        last = (-1, -1)
+        while True:
+            with closing(self.connect()) as conn:
+                found = conn.execute(
+                    "SELECT file_idx, seq, row FROM job_rows WHERE job_id = ? AND (file_idx, seq) > (?, ?) "
+                    "ORDER BY file_idx, seq LIMIT ?",
+                    (job_id, *last, batch),
+                ).fetchall()
+            for r in found:
+                yield json.loads(r["row"])
+            if len(found) < batch:
+                return
+            last = (found[-1]["file_idx"], found[-1]["seq"])
+
+
+class Lease:
+    # Renews a claimed job's lease from a background thread while the worker
+    # runs it. lost is set once another worker has taken the job over.
+
+    def __init__(self, store: JobStore, job_id: str, worker: str):
+        self.store, self.job_id, self.worker = store, job_id, worker
+        self.lost = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._renew, daemon=True)
+
+    def _renew(self):
+        while not self._done.wait(JOB_LEASE_SECONDS / 4):
+            try:
+                if not self.store.renew(self.job_id, self.worker):
+                    self.lost.set()
+                    return
+            except sqlite3.Error:
+                traceback.print_exc()
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLostError(f"job {self.job_id} was taken over by another worker")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def run_job(store: JobStore, job_id: str, lease: Optional[Lease] = None):
+    for f in store.pending_files(job_id):
+        file_idx, path = f["file_idx"], f["path"]
+        if lease is not None:
+            lease.check()
+        store.reset_file(job_id, file_idx)
+
+        seq = 0
+        try:
+            for pages_done, rows in pii_engine.iter_document_pages(path):
+                if lease is not None:
+                    lease.check()
+                store.add_page(job_id, file_idx, seq, pages_done, rows)
+                seq += len(rows)
+        except (pii_engine.ModelUnavailableError, LeaseLostError):
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            store.finish_file(job_id, file_idx, str(e))
+            continue
+
+        store.finish_file(job_id, file_idx)
+
+
+def worker_main(db_path: str, stop_event):
+    store = JobStore(db_path)
+    worker = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    while not stop_event.is_set():
+        job_id = store.claim(worker)
+        if job_id is None:
+            stop_event.wait(POLL_SECONDS)
+            continue
+
+        with Lease(store, job_id, worker) as lease:
+            try:
+                run_job(store, job_id, lease)
+            except LeaseLostError:
+                # the job is someone else's now; leave it alone
+                continue
+            except Exception as e:
+                traceback.print_exc()
+                store.finish_job(job_id, str(e), worker)
+                continue
+
+            finished = store.finish_job(job_id, worker=worker)
+        if finished:
+            # inputs are no longer needed once the rows are stored
+            shutil.rmtree(store.work_dir(job_id), ignore_errors=True)
+
+
+class StopFlag:
+    # Shutdown signal shared with the worker processes. Not a
+    # multiprocessing.Event: a worker killed while waiting on one leaves it
+    # broken, and the next set() hangs.
+
+    def __init__(self, ctx=multiprocessing):
+        self._value = ctx.RawValue("b", 0)
+
+    def set(self):
+        self._value.value = 1
+
+    def is_set(self) -> bool:
+        return bool(self._value.value)
+
+    def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.is_set():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            time.sleep(min(left, 0.1))
+        return self.is_set()
+
+
+def _start_worker(ctx, db_path: str, stop_event):
+    p = ctx.Process(target=worker_main, args=(db_path, stop_event), daemon=True)
+    p.start()
+    return p
+
+
+def _supervise(ctx, db_path: str, processes: list, stop_event):
+    # replaces workers that died (killed for memory, crashed in a native
+    # library); their jobs are picked up again once the lease runs out
+    while not stop_event.wait(SUPERVISE_SECONDS):
+        for i, p in enumerate(processes):
+            if not p.is_alive() and not stop_event.is_set():
+                p.join()
+                print(f"job worker {p.pid} exited with {p.exitcode}, restarting", flush=True)
+                processes[i] = _start_worker(ctx, db_path, stop_event)
+
+
+def start_workers(db_path: str = JOB_DB_PATH, count: int = JOB_WORKERS):
+    # Returns (processes, stop_event). Set the event and join to shut down.
+    # A thread in this process restarts workers that die; the list is
+    # updated in place.
+    ctx = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing
+    stop_event = StopFlag(ctx)
+    processes = [_start_worker(ctx, db_path, stop_event) for _ in range(count)]
+    threading.Thread(target=_supervise, args=(ctx, db_path, processes, stop_event), daemon=True).start()
+    return processes, stop_event
@@ -0,0 +1,142 @@
+# metrics.py
+# Per-stage timers and counters for the extraction engine.
+#
+# pii_engine wraps its stages in `with stage("ocr"):` and bumps counters with
+# count("pages"). Both are no-ops unless a collector is active in the
+# current thread (collect()), so library use costs one attribute lookup per
+# call. With PII_METRICS=0 nothing is ever collected.
+#
+# Stage times are wall time spent inside the stage. Stages can nest, e.g.
+# "ner" also runs inside "excel_extract", so do not add the stages up.
+# Workers send their StageMetrics back with their results and the caller
+# merges them, so the totals cover every process of a run.
+
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+METRICS_ENABLED = os.getenv("PII_METRICS", "1") == "1"
+
+
+class StageMetrics:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def merge(self, other):
+        # other: StageMetrics or its as_dict() form (from a worker process)
+        if isinstance(other, StageMetrics):
+            other = other.as_dict()
+        for name, s in other.get("stages", {}).items():
+            self.seconds[name] += s["seconds"]
+            self.calls[name] += s["calls"]
+        for name, n in other.get("counters", {}).items():
+            self.counters[name] += n
+
+    def as_dict(self) -> Dict:
+        return {
+            "stages": {
+                name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+                for name in sorted(self.seconds)
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+_local = threading.local()
+_NULL = nullcontext()
+
+
+def current() -> Optional[StageMetrics]:
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def collect(metrics: Optional[StageMetrics] = None):
+    # Activates a collector for this thread. A nested collect() adds what it
+    # gathered to the outer collector when it exits.
+    metrics = metrics if metrics is not None else StageMetrics()
+    if not METRICS_ENABLED:
+        yield metrics
+        return
+
+    outer = current()
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = outer
+        if outer is not None and outer is not metrics:
+            outer.merge(metrics)
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: StageMetrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name: str):
+    metrics = getattr(_local, "metrics", None)
+    if metrics is None:
+        return _NULL
+    return _StageTimer(metrics, name)
+
+
+def count(name: str, n: int = 1):
+    metrics = getattr(_local, "metrics", None)
+    if metrics is not None:
+        metrics.counters[name] += n
+
+
+# PROCESS-WIDE TOTALS
+# The API adds every finished request to REGISTRY; /metrics renders it.
+
+REGISTRY = StageMetrics()
+_registry_lock = threading.Lock()
+
+
+def record(metrics):
+    with _registry_lock:
+        REGISTRY.merge(metrics)
+
+
+def render_prometheus(metrics: StageMetrics = REGISTRY, gauges: Optional[Dict[str, float]] = None) -> str:
+    with _registry_lock:
+        snapshot = metrics.as_dict()
+
+    lines = [
+        "# HELP pii_stage_seconds_total Wall time spent in each extraction stage.",
+        "# TYPE pii_stage_seconds_total counter",
+    ]
+    lines += [f'pii_stage_seconds_total{{stage="{name}"}} {s["seconds"]:.6f}' for name, s in snapshot["stages"].items()]
+    lines += [
+        "# HELP pii_stage_calls_total Times each extraction stage ran.",
+        "# TYPE pii_stage_calls_total counter",
+    ]
+    lines += [f'pii_stage_calls_total{{stage="{name}"}} {s["calls"]}' for name, s in snapshot["stages"].items()]
+
+    for name, n in snapshot["counters"].items():
+        lines += [f"# TYPE pii_{name}_total counter", f"pii_{name}_total {n}"]
+
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE pii_{name} gauge", f"pii_{name} {value}"]
+
+    return "\n".join(lines) + "\n"
@@ -3,26 +3,192 @@ import re
 import os
 import magic
 import fitz  
-import spacy
+import numpy as np
 import pandas as pd
+import openpyxl
 import pytesseract
-from docx import Document
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import json
+import hashlib
+import io
+import logging
+import zlib
+import zipfile
+from lxml import etree
 from datetime import datetime
 import traceback
+import time
+import threading
+import multiprocessing
 from rapidfuzz import fuzz
-from collections import defaultdict
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict, deque
+from functools import cached_property
+from itertools import zip_longest
+from concurrent.futures import Future, ProcessPoolExecutor
+from result_cache import file_sha256, get_default_cache
+from result_table import LIST_FIELDS, ResultTable
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
 
 tess_path = os.getenv("TESSERACT_PATH")
 if tess_path:
     pytesseract.pytesseract.tesseract_cmd = tess_path
 
-try:
-    nlp = spacy.load("en_core_web_sm")
-except:
-    os.system("python -m spacy download en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
+# SPACY MODEL
+# Loaded on first use. Only PERSON entities are read, so everything except NER
+# (and the tok2vec layer, if NER listens to it) is left out of the pipeline.
+
+SPACY_MODEL = os.getenv("PII_SPACY_MODEL", "en_core_web_sm")
+SPACY_EXCLUDE = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter", "morphologizer"]
+
+
+class ModelUnavailableError(RuntimeError):
+    pass
+
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                _nlp = _load_nlp()
+    return _nlp
+
+
+def _load_nlp():
+    import spacy
+
+    try:
+        nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+    except OSError as e:
+        raise ModelUnavailableError(
+            f"spaCy model '{SPACY_MODEL}' is not installed. "
+            f"Install it with: python -m spacy download {SPACY_MODEL}"
+        ) from e
+
+    if "tok2vec" in nlp.pipe_names and "ner" in nlp.pipe_names:
+        if "ner" not in getattr(nlp.get_pipe("tok2vec"), "listening_components", []):
+            nlp.remove_pipe("tok2vec")
+
+    return nlp
+
+
+def preload_model():
+    # Call before forking workers so they share the parent's copy of the model.
+    get_nlp()
+
+
+# Texts per nlp.pipe batch and spaCy worker processes for batched NER
+NER_BATCH_SIZE = int(os.getenv("PII_NER_BATCH_SIZE", "64"))
+NER_PROCESSES = int(os.getenv("PII_NER_PROCESSES", "1"))
+
+
+def person_entities(text: str) -> List[str]:
+    with metrics.stage("ner"):
+        return [ent.text for ent in get_nlp()(text).ents if ent.label_ == "PERSON"]
+
+
+def batch_person_entities(texts, batch_size: Optional[int] = None, n_process: Optional[int] = None) -> Dict[str, List[str]]:
+    # PERSON entities for many texts through one nlp.pipe call, keyed by text.
+    unique = list(dict.fromkeys(texts))
+    if not unique:
+        return {}
+
+    with metrics.stage("ner"):
+        docs = get_nlp().pipe(
+            unique,
+            batch_size=batch_size or NER_BATCH_SIZE,
+            n_process=n_process or NER_PROCESSES,
+        )
+        return {
+            text: [ent.text for ent in doc.ents if ent.label_ == "PERSON"]
+            for text, doc in zip(unique, docs)
+        }
+
+
+# INPUT SOURCES
+# A file to extract is either a path or an InMemoryFile: an upload that was
+# never written to disk. Every reader goes through the helpers below, so PDFs
+# open from the buffer (fitz stream=), images are decoded with cv2.imdecode,
+# DOCX/XLSX zips are read from a BytesIO, and type sniffing looks at the
+# buffer's first bytes.
+
+
+class InMemoryFile:
+    __slots__ = ("name", "data")
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+
+    def __repr__(self):
+        return f"InMemoryFile({self.name!r}, {len(self.data)} bytes)"
+
+
+def as_source(item):
+    # path (str or os.PathLike), InMemoryFile, bytes or a binary file object
+    # (read in full); None for anything else
+    if isinstance(item, (str, InMemoryFile)):
+        return item
+    if isinstance(item, os.PathLike):
+        return os.fsdecode(item)
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        return InMemoryFile("", bytes(item))
+    if hasattr(item, "read"):
+        return InMemoryFile(os.path.basename(str(getattr(item, "name", ""))), item.read())
+    return None
+
+
+def source_name(source) -> str:
+    return source.name if isinstance(source, InMemoryFile) else os.path.basename(source)
+
+
+def source_size(source) -> int:
+    return len(source.data) if isinstance(source, InMemoryFile) else os.path.getsize(source)
+
+
+def source_sha256(source) -> str:
+    if isinstance(source, InMemoryFile):
+        return hashlib.sha256(source.data).hexdigest()
+    return file_sha256(source)
+
+
+def source_file(source):
+    # for readers that take a path or a binary file object (zipfile, openpyxl, pandas)
+    return io.BytesIO(source.data) if isinstance(source, InMemoryFile) else source
+
+
+def open_pdf(source):
+    if isinstance(source, InMemoryFile):
+        return fitz.open(stream=source.data, filetype="pdf")
+    return fitz.open(source)
+
+
+# libmagic needs more than the zip header to tell DOCX from XLSX
+MAGIC_HEADER_BYTES = 1 << 16
+_magic = None
+_magic_lock = threading.Lock()
+
+
+def sniff_mime(source) -> str:
+    # one detector per process; libmagic handles are not thread-safe
+    global _magic
+    if isinstance(source, InMemoryFile):
+        header = source.data[:MAGIC_HEADER_BYTES]
+    else:
+        with open(source, "rb") as f:
+            header = f.read(MAGIC_HEADER_BYTES)
+    with _magic_lock:
+        if _magic is None:
+            _magic = magic.Magic(mime=True)
+        return _magic.from_buffer(header)
 
 
 class DocType:
@@ -32,9 +198,9 @@ class DocType:
     EXCEL = "excel"
     UNSUPPORTED = "unsupported"
 
-def identify_file(file_path: str) -> str:
+def identify_file(file_path) -> str:
     #Extension Based
-    ext = os.path.splitext(file_path)[1].lower()
+    ext = os.path.splitext(source_name(file_path))[1].lower()
     if ext in ['.png', '.jpg', '.jpeg']: return DocType.IMAGE
     if ext == '.pdf': return DocType.PDF
     if ext == '.docx': return DocType.DOCX
@@ -42,8 +208,8 @@ def identify_file(file_path: str) -> str:
 
     
     try:
-        mime = magic.Magic(mime=True)
-        mtype = mime.from_file(file_path)
+        with metrics.stage("detect"):
+            mtype = sniff_mime(file_path)
         if "image" in mtype: return DocType.IMAGE
         if "pdf" in mtype: return DocType.PDF
         if "officedocument.wordprocessingml" in mtype: return DocType.DOCX
@@ -52,11 +218,110 @@ def identify_file(file_path: str) -> str:
         return DocType.UNSUPPORTED
 
 
-def production_preprocess(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    denoised = cv2.bilateralFilter(gray, 7, 50, 50)
-    #for varying lighting
-    thresh = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 21, 4)
+# PREPROCESSING
+# Each image is routed by cheap quality measures taken on a copy at most
+# QUALITY_SIDE pixels long:
+#  - contrast: gap between the mean ink and mean paper gray levels
+#  - unevenness: spread of the paper (background) level across the image,
+#    i.e. shadows, lighting gradients, coloured bands, photo backgrounds
+#  - sharpness: |Laplacian| on the edges, relative to contrast, so faint but
+#    crisp print counts as sharp and sparse forms are not mistaken for blur
+#  - skew: median angle of the text line blobs
+# Evenly lit, straight, reasonably sharp images (digital renders, flatbed
+# scans) get a global Otsu threshold, which reads them as well as the full
+# path at a tenth of the cost, grain and JPEG noise included. The rest get
+# bilateral denoising + adaptive threshold, deskewed first when tilted.
+# PII_PREPROCESS=fast / full forces one path.
+
+PREPROCESS_MODE = os.getenv("PII_PREPROCESS", "auto")
+QUALITY_SIDE = 1000
+CLEAN_MIN_CONTRAST = 30
+CLEAN_MAX_UNEVENNESS = 40
+CLEAN_MIN_SHARPNESS = 1.0
+DESKEW_MIN_ANGLE = 1.0
+DESKEW_MAX_ANGLE = 10.0
+
+
+def text_skew(small) -> float:
+    # degrees to rotate by (cv2.getRotationMatrix2D) to level the text lines
+    _, bw = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, small.shape[1] // 50), 1))
+    contours, _ = cv2.findContours(cv2.morphologyEx(bw, cv2.MORPH_CLOSE, kernel), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    angles = []
+    for c in contours:
+        (_, _), (w, h), angle = cv2.minAreaRect(c)
+        if w < h:
+            w, h, angle = h, w, angle - 90
+        if h < 2 or w < 5 * h or w < small.shape[1] // 10:
+            continue  # not a text line
+        angles.append((angle + 45) % 90 - 45)
+    return float(np.median(angles)) if angles else 0.0
+
+
+def image_quality(gray) -> Dict[str, float]:
+    scale = QUALITY_SIDE / max(gray.shape)
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    t, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    ink, paper = small[small <= t], small[small > t]
+    contrast = float(paper.mean() - ink.mean()) if ink.size and paper.size else 0.0
+    laplacian = np.abs(cv2.Laplacian(small, cv2.CV_16S))
+    edges = laplacian[laplacian > contrast / 4]
+
+    # at a quarter of that size a 7x7 max filter wipes out the text and
+    # leaves the paper
+    tiny = cv2.resize(small, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    background = cv2.dilate(tiny, np.ones((7, 7), np.uint8))
+    lo, hi = np.percentile(background, (5, 95))
+
+    return {
+        "contrast": contrast,
+        "unevenness": float(hi - lo),
+        "sharpness": float(np.percentile(edges, 90) / contrast) if edges.size else 0.0,
+        "skew": text_skew(small),
+    }
+
+
+def is_clean_image(quality: Dict[str, float]) -> bool:
+    return (
+        quality["contrast"] >= CLEAN_MIN_CONTRAST
+        and quality["unevenness"] <= CLEAN_MAX_UNEVENNESS
+        and quality["sharpness"] >= CLEAN_MIN_SHARPNESS
+        and abs(quality["skew"]) < DESKEW_MIN_ANGLE
+    )
+
+
+def deskew_image(gray, angle: float):
+    h, w = gray.shape
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def production_preprocess(image, deskew: bool = True):
+    # accepts BGR or an already-grayscale (2-D) image
+    # deskew=False keeps pixel positions, for callers that OCR boxes found
+    # on the unprocessed image
+    with metrics.stage("preprocess"):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        quality = None
+        if PREPROCESS_MODE != "fast":
+            with metrics.stage("image_quality"):
+                quality = image_quality(gray)
+
+        if PREPROCESS_MODE == "fast" or PREPROCESS_MODE == "auto" and is_clean_image(quality):
+            with metrics.stage("preprocess_fast"):
+                _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+            return thresh
+
+        with metrics.stage("preprocess_full"):
+            if deskew and DESKEW_MIN_ANGLE <= abs(quality["skew"]) <= DESKEW_MAX_ANGLE:
+                gray = deskew_image(gray, quality["skew"])
+                metrics.count("deskewed")
+            denoised = cv2.bilateralFilter(gray, 7, 50, 50)
+            #for varying lighting
+            thresh = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 21, 4)
     return thresh
 
 
@@ -80,24 +345,232 @@ INDIAN_STATES = [
 
 PIN_REGEX = re.compile(r"\b\d{6}\b")
 
+# PATTERN REGISTRY
+# Everything below is compiled once at import; the extractors run per page /
+# per Excel row so nothing should be built inside them.
+
+STRUCTURED_ID_PATTERNS = {
+    "pan": r"[A-Z]{5}[0-9]{4}[A-Z]",
+    "aadhaar": r"\b\d{4}\s?\d{4}\s?\d{4}\b",
+    "voter_id": r"\b[A-Z]{3}[0-9]{7}\b",
+    "dl": r"\b[A-Z]{2}[ -]?[0-9]{2}(?:[ -]?[0-9]{4}){2,3}\b",
+    "phone": r"(?:\+91[\s-]?)?[6-9]\d{4}[\s-]?\d{5}",
+    "email": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
+}
+
+# Priority when two detectors match at the same place: an email wins over the
+# digits inside it, and a DL / Aadhaar number wins over a phone-shaped run of
+# its own digits.
+STRUCTURED_ID_SCAN_ORDER = ("email", "pan", "voter_id", "dl", "aadhaar", "phone")
+
+STRUCTURED_ID_REGEX = re.compile("|".join(
+    f"(?P<{kind}>{STRUCTURED_ID_PATTERNS[kind]})" for kind in STRUCTURED_ID_SCAN_ORDER
+))
+
+DOB_LABELED_REGEX = re.compile(
+    r"(?:DOB|Date of Birth|Birth)[:\s-]*(\d{2}[/-]\d{2}[/-]\d{2,4})",
+    re.IGNORECASE
+)
+DOB_BARE_REGEX = re.compile(r"\b\d{2}[/-]\d{2}[/-]\d{4}\b")
+
+NON_DIGIT_REGEX = re.compile(r"\D")
+
+ADDRESS_LABEL_STRIP_REGEX = re.compile(r"(?i)(address|location|thikana|Residence|Details)\s*[:,-]*")
+ADDRESS_END_TERM_REGEX = re.compile(r"\b(?:PAN|AADHAAR|DOB)\b")
+ADDRESS_STOP_REGEX = re.compile(
+    r"\b(pan|aadhaar|dob|gender|mobile|email|name|signature|date)\b",
+    re.IGNORECASE
+)
+
+STREET_KEYWORDS = ["road", "rd", "street", "st", "sector", "block", "flat", "floor", "apartment", "lane"]
+
+PROSE_KEYWORDS = [
+    "was", "were", "is", "are", "access", "affected", "revealed",
+    "analysis", "observed", "results", "exposed", "confidential",
+    "unauthorized", "system", "management", "requirement", "standard"
+]
+
+NAME_ANCHORS = ["name", "applicant", "nominee", "holder"]
+IDENTITY_KEYWORDS = [
+    "dob", "date of birth", "birth", "sex", "gender",
+    "valid", "validity", "issue", "issued", "expiry",
+]
+# words that mark a short OCR line as card furniture rather than a name
+OCR_NOISE_WORDS = [
+    "government", "india", "uidai", "income", "tax",
+    "department", "address", "male", "female",
+    "year", "birth", "dob", "aadhaar", "permanent", "identification",
+]
+NAME_BLACKLIST = frozenset([
+    "INDIA", "GOVT", "INCOME", "TAX", "UNIQUE", "AUTHORITY",
+    "FATHER", "MOTHER", "MALE", "FEMALE",
+] + [s.upper() for s in INDIAN_STATES])
+
+# KEYWORD INDEX
+# All keyword lists above folded into one case-insensitive, word-bounded
+# alternation (longest keyword first), so a text is scanned once and every
+# heuristic reads its hits from the result instead of looping over a list.
+# A keyword can belong to several lists ("block" is address and street).
+
+KEYWORD_LISTS = {
+    "address": ADDRESS_KEYWORDS,
+    "state": INDIAN_STATES,
+    "street": STREET_KEYWORDS,
+    "prose": PROSE_KEYWORDS,
+    "anchor": NAME_ANCHORS,
+    "identity": IDENTITY_KEYWORDS,
+    "ocr_noise": OCR_NOISE_WORDS,
+}
+
+KEYWORD_KINDS = defaultdict(set)
+for _kind, _words in KEYWORD_LISTS.items():
+    for _word in _words:
+        KEYWORD_KINDS[_word.lower()].add(_kind)
+KEYWORD_KINDS = {word: frozenset(kinds) for word, kinds in KEYWORD_KINDS.items()}
+
+NO_KEYWORDS = frozenset()
+
+
+def _trie_pattern(words) -> str:
+    # Alternation factored on common prefixes ("st(?:reet)?" rather than
+    # "street|st"): same longest-first matches, but re no longer retries
+    # every keyword at every position.
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+KEYWORD_REGEX = re.compile(r"\b(?=\w)(?:" + _trie_pattern(KEYWORD_KINDS) + r")\b", re.IGNORECASE)
+
+CARD_ID_REGEX = re.compile(r"\b\d{4}[\s-]?\d{4}\b|\b[A-Z]{2,}\d{4,}\b")
+NAME_ANCHOR_SPLIT_REGEX = re.compile(r"NAME|APPLICANT|NOMINEE|HOLDER", re.IGNORECASE)
+APPLICANT_SPLIT_REGEX = re.compile(r"(?i)Applicant\s+\d+")
+
+
+def scan_keywords(text: str) -> List[Tuple[str, int, int]]:
+    # (keyword, start, end) for every keyword hit, keyword lowercased
+    return [(m.group().lower(), m.start(), m.end()) for m in KEYWORD_REGEX.finditer(text)]
+
+
+def keyword_kinds(text: str) -> set:
+    # which keyword lists occur anywhere in text
+    kinds = set()
+    for kw, _, _ in scan_keywords(text):
+        kinds |= KEYWORD_KINDS[kw]
+    return kinds
+
+
+def line_keyword_kinds(lines: List[str]) -> List[frozenset]:
+    # keyword_kinds for each line, from a single scan of the joined lines
+    kinds = [NO_KEYWORDS] * len(lines)
+    starts, pos = [], 0
+    for line in lines:
+        starts.append(pos)
+        pos += len(line) + 1
+    for kw, start, _ in scan_keywords("\n".join(lines)):
+        i = bisect_right(starts, start) - 1
+        kinds[i] = kinds[i] | KEYWORD_KINDS[kw]
+    return kinds
+
+
+def scan_structured_ids(text: str) -> List[Tuple[str, int, int, str]]:
+    # One pass over the text for every structured ID type.
+    # Returns (type, start, end, value) in text order.
+    return [
+        (m.lastgroup, m.start(), m.end(), m.group())
+        for m in STRUCTURED_ID_REGEX.finditer(text)
+    ]
+
 
-def extract_address_indian(text: str) -> str:
-    lines = [l.strip() for l in text.split('\n') if l.strip()]
+# DOCUMENT TEXT
+# A text split into stripped, non-empty lines once, with the views the
+# heuristics need built on first use and then shared, instead of every
+# extractor re-splitting and re-casing the same text.
+
+class DocumentText:
+    def __init__(self, text: str):
+        self.text = text
+        self.lines = []
+        self.offsets = []  # start of each stripped line in text
+        pos = 0
+        for raw in text.split("\n"):
+            line = raw.strip()
+            if line:
+                self.lines.append(line)
+                self.offsets.append(pos + len(raw) - len(raw.lstrip()))
+            pos += len(raw) + 1
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def upper_lines(self) -> List[str]:
+        return [l.upper() for l in self.lines]
+
+    @cached_property
+    def word_counts(self) -> List[int]:
+        return [len(l.split()) for l in self.lines]
+
+    @cached_property
+    def line_kinds(self) -> List[frozenset]:
+        # keyword lists hit on each line, from one scan of the whole text
+        kinds = [NO_KEYWORDS] * len(self.lines)
+        offsets = self.offsets
+        for m in KEYWORD_REGEX.finditer(self.text):
+            i = bisect_right(offsets, m.start()) - 1
+            kinds[i] = kinds[i] | KEYWORD_KINDS[m.group().lower()]
+        return kinds
+
+    @cached_property
+    def name_lines(self) -> List[str]:
+        # lines as the name heuristics see them: quotes and edge commas gone
+        return [l.replace('"', '').strip(", ") for l in self.lines]
+
+    @cached_property
+    def name_line_kinds(self) -> List[frozenset]:
+        # trimming edge commas/spaces never changes a word-bounded hit, only
+        # dropping quotes from inside a line can
+        if '"' not in self.text:
+            return self.line_kinds
+        return line_keyword_kinds(self.name_lines)
+
+
+def as_document(text) -> DocumentText:
+    return text if isinstance(text, DocumentText) else DocumentText(text)
+
+
+def extract_address_indian(text) -> str:
+    doc = as_document(text)
+    lines = doc.lines
+    kinds = doc.line_kinds
     address_parts = []
     capturing = False
 
     for i, line in enumerate(lines):
-        upper_line = line.upper()
+        upper_line = doc.upper_lines[i]
 
         if not capturing:
-            if any(re.search(rf"\b{kw}\b", line, re.IGNORECASE) for kw in ADDRESS_KEYWORDS):
+            if "address" in kinds[i]:
                 capturing = True
-                clean = re.sub(r"(?i)(address|location|thikana|Residence|Details)\s*[:,-]*", "", line).strip()
+                clean = ADDRESS_LABEL_STRIP_REGEX.sub("", line).strip()
                 if clean: address_parts.append(clean)
                 continue
 
         if capturing:
-            if any(re.search(rf"\b{term}\b", upper_line) for term in ["PAN", "AADHAAR", "DOB"]):
+            if ADDRESS_END_TERM_REGEX.search(upper_line):
                 break
 
             address_parts.append(line)
@@ -105,7 +578,7 @@ def extract_address_indian(text: str) -> str:
             if PIN_REGEX.search(line):
                 break
 
-            if any(s.upper() in upper_line for s in INDIAN_STATES):
+            if "state" in kinds[i]:
                 if i+1 < len(lines) and not PIN_REGEX.search(lines[i+1]):
                     break
 
@@ -113,16 +586,13 @@ def extract_address_indian(text: str) -> str:
     return re.sub(r'\s+', ' ', res) if res else ""
 
 
-def extract_name_from_ocr_lines(lines):
+def extract_name_from_ocr_lines(lines, kinds=None):
     probable_names = []
 
-    blacklist = {
-        "government", "india", "uidai", "income", "tax",
-        "department", "address", "male", "female",
-        "year", "birth", "dob","Aadhaar", "permanent", "identification",
-    }
+    if kinds is None:
+        kinds = line_keyword_kinds(lines)
 
-    for line in lines:
+    for line, line_kinds in zip(lines, kinds):
         clean = line.strip()
         if not (3 <= len(clean) <= 40):
             continue
@@ -139,7 +609,7 @@ def extract_name_from_ocr_lines(lines):
         if clean.isupper() and len(words) == 1:
             continue
 
-        if any(b in clean.lower() for b in blacklist):
+        if "ocr_noise" in line_kinds:
             continue
 
         # Title-case heuristic
@@ -151,26 +621,28 @@ def extract_name_from_ocr_lines(lines):
 
 # TEXT CLEANUP 
 
-SEPARATOR_LINE_REGEX = r"[-_]{5,}|\.{5,}"
+SEPARATOR_LINE_REGEX = re.compile(r"[-_]{5,}|\.{5,}")
+MULTI_SPACE_REGEX = re.compile(r"\s{2,}")
+MULTI_NEWLINE_REGEX = re.compile(r"\n{3,}")
 
 def clean_extracted_address(addr: str) -> str:
     if not addr:
         return addr
 
     # Remove dash separators
-    addr = re.sub(SEPARATOR_LINE_REGEX, "", addr)
+    addr = SEPARATOR_LINE_REGEX.sub("", addr)
 
     addr = addr.strip(" .,-:")
 
-    addr = re.sub(r"\s{2,}", " ", addr)
+    addr = MULTI_SPACE_REGEX.sub(" ", addr)
 
     return addr.strip()
 
 
 def clean_text_global(text: str) -> str:
-    text = re.sub(SEPARATOR_LINE_REGEX, "\n", text)
+    text = SEPARATOR_LINE_REGEX.sub("\n", text)
 
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = MULTI_NEWLINE_REGEX.sub("\n\n", text)
 
     return text.strip()
 
@@ -198,8 +670,9 @@ ADDRESS_LABEL_REGEX = re.compile(
     re.IGNORECASE
 )
 
-def extract_address_strict(text: str) -> str:
-    lines = [l.strip() for l in text.split("\n") if l.strip()]
+def extract_address_strict(text) -> str:
+    doc = as_document(text)
+    lines = doc.lines
 
     for i, line in enumerate(lines):
         m = ADDRESS_LABEL_REGEX.search(line)
@@ -212,34 +685,29 @@ def extract_address_strict(text: str) -> str:
         
             j = i + 1
             temp_parts = addr_parts.copy()
-            word_count = len(" ".join(addr_parts).split())
+            word_count = len(first.split())
             MAX_ADDRESS_WORDS = 35  #assuming max words in address
             
             while j < len(lines) and word_count < MAX_ADDRESS_WORDS:
-                stop = re.search(
-                    r"\b(pan|aadhaar|dob|gender|mobile|email|name|signature|date)\b",
-                    lines[j],
-                    re.IGNORECASE,
-                )
-                if stop:
+                if ADDRESS_STOP_REGEX.search(lines[j]):
                     break
                 
                 if len(lines[j]) < 4:
                     break
                 
                 temp_parts.append(lines[j])
-                word_count = len(" ".join(temp_parts).split())
+                word_count += doc.word_counts[j]
                 j += 1
             
             # Backward scan 
             final_idx = -1
+            part_kinds = line_keyword_kinds(addr_parts) + doc.line_kinds[i + 1:j]
             
             for idx in range(len(temp_parts) - 1, -1, -1):
                 part = temp_parts[idx]
-                part_lower = part.lower()
                 
                 has_pincode = PIN_REGEX.search(part)
-                has_state = any(state in part_lower for state in INDIAN_STATES)
+                has_state = "state" in part_kinds[idx]
                 
                 if has_pincode or has_state:
                     final_idx = idx
@@ -270,11 +738,7 @@ def extract_address_near_name(text: str, name: str) -> str:
     # check around name 
     window = text[max(0, idx-200): idx+500]
 
-    match = re.search(
-        r"(residing at|resident of|living at)\s+(.+?)(?:\.|\n)", 
-        window, 
-        re.IGNORECASE
-    )
+    match = NARRATIVE_ADDRESS_REGEX.search(window)
 
     if match:
         addr = match.group(2).strip()
@@ -287,133 +751,113 @@ def like_real_address(addr: str) -> bool:
         return False
 
     score = 0
-    addr_lc = addr.lower()
+    hits = {kw for kw, _, _ in scan_keywords(addr)}
+    kinds = set().union(*(KEYWORD_KINDS[kw] for kw in hits))
 
     if PIN_REGEX.search(addr):
         score += 2
 
-    if any(s in addr_lc for s in INDIAN_STATES):
+    if "state" in kinds:
         score += 1
 
-    if any(k in addr_lc for k in ["road", "rd", "street", "st", "sector", "block", "flat", "floor", "apartment", "lane"]):
+    if "street" in kinds:
         score += 1
 
-    # INCREASED PENALTY
-    prose_keywords = [
-        "was", "were", "is", "are", "access", "affected", "revealed", 
-        "analysis", "observed", "results", "exposed", "confidential", 
-        "unauthorized", "system", "management", "requirement", "standard"
-    ]
-    
-    for kw in prose_keywords:
-        if re.search(rf"\b{kw}\b", addr_lc):
-            score -= 2 
+    # INCREASED PENALTY (once per distinct prose word)
+    score -= 2 * sum(1 for kw in hits if "prose" in KEYWORD_KINDS[kw])
 
     return score >= 2
 
 
-def extract_pii_hybrid(text: str) -> Dict:
-    raw_text = clean_text_global(text)
-
-    patterns = {
-        "pan": r"[A-Z]{5}[0-9]{4}[A-Z]",
-        "aadhaar": r"\b\d{4}\s?\d{4}\s?\d{4}\b",
-        "voter_id": r"\b[A-Z]{3}[0-9]{7}\b",
-        "dl": r"\b[A-Z]{2}[ -]?[0-9]{2}(?:[ -]?[0-9]{4}){2,3}\b",
-        "phone": r"(?:\+91[\s-]?)?[6-9]\d{4}[\s-]?\d{5}",
-        "email": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"
-
-    }
-
-    results = {k: list(set(re.findall(v, raw_text))) for k, v in patterns.items()}
-     #PHONE NORMALIZATION 
-    if results.get("phone"):
-        norm_phones = []
-        for p in results["phone"]:
-            digits = re.sub(r"\D", "", p)
-            if len(digits) == 12 and digits.startswith("91"):
-                digits = digits[2:]
-            if len(digits) == 10:
-                norm_phones.append(digits)
-        results["phone"] = list(set(norm_phones))
-
-
-    DOB_LABELED_REGEX = r"(?:DOB|Date of Birth|Birth)[:\s-]*(\d{2}[/-]\d{2}[/-]\d{2,4})"
-    DOB_BARE_REGEX = r"\b\d{2}[/-]\d{2}[/-]\d{4}\b"
-
-    dob_matches = re.findall(DOB_LABELED_REGEX, raw_text, flags=re.IGNORECASE)
-
-    narrative_matches = DOB_NARRATIVE_REGEX.findall(raw_text)
-
-    if narrative_matches:
-        results["dob"] = [narrative_matches[0][1]]
-    elif dob_matches:
-        results["dob"] = [dob_matches[0]]
-    else:
-        bare_dates = re.findall(DOB_BARE_REGEX, raw_text)
-        results["dob"] = bare_dates[:1] if bare_dates else []
+def extract_pii_hybrid(text, ner_cache: Optional[Dict[str, List[str]]] = None) -> Dict:
+    # text: raw text, or a DocumentText over already cleaned text.
+    # ner_cache: PERSON entities precomputed by batch_person_entities, keyed by
+    # the cleaned text; texts missing from it go through spaCy one by one.
+    doc = text if isinstance(text, DocumentText) else DocumentText(clean_text_global(text))
+    raw_text = doc.text
+
+    with metrics.stage("regex"):
+        results = {k: [] for k in STRUCTURED_ID_PATTERNS}
+        for kind, _, _, value in scan_structured_ids(raw_text):
+            results[kind].append(value)
+        results = {k: list(dict.fromkeys(v)) for k, v in results.items()}
+         #PHONE NORMALIZATION 
+        if results.get("phone"):
+            norm_phones = []
+            for p in results["phone"]:
+                digits = NON_DIGIT_REGEX.sub("", p)
+                if len(digits) == 12 and digits.startswith("91"):
+                    digits = digits[2:]
+                if len(digits) == 10:
+                    norm_phones.append(digits)
+            results["phone"] = list(dict.fromkeys(norm_phones))
+
+
+        dob_matches = DOB_LABELED_REGEX.findall(raw_text)
+
+        narrative_matches = DOB_NARRATIVE_REGEX.findall(raw_text)
+
+        if narrative_matches:
+            results["dob"] = [narrative_matches[0][1]]
+        elif dob_matches:
+            results["dob"] = [dob_matches[0]]
+        else:
+            bare_dates = DOB_BARE_REGEX.findall(raw_text)
+            results["dob"] = bare_dates[:1] if bare_dates else []
 
     detected_names = []
 
-    addr = extract_address_strict(raw_text)
-
-    # Narrative address 
-    if not addr:
-       m = NARRATIVE_ADDRESS_REGEX.search(raw_text)
-       if m:
-         candidate = clean_extracted_address(m.group(2))
-         if like_real_address(candidate):
-            addr = candidate
-
-    # Heuristic Indian address 
-    if not addr:
-        candidate = extract_address_indian(raw_text)
-        if like_real_address(candidate):
-            addr = candidate
-        else:
-            addr = ""
+    with metrics.stage("address"):
+        addr = extract_address_strict(doc)
+
+        # Narrative address 
+        if not addr:
+           m = NARRATIVE_ADDRESS_REGEX.search(raw_text)
+           if m:
+             candidate = clean_extracted_address(m.group(2))
+             if like_real_address(candidate):
+                addr = candidate
+
+        # Heuristic Indian address 
+        if not addr:
+            candidate = extract_address_indian(doc)
+            if like_real_address(candidate):
+                addr = candidate
+            else:
+                addr = ""
 
-    results["address"] = [addr] if addr else []
+        results["address"] = [addr] if addr else []
 
     address_lc = " ".join(results["address"]).lower() if results["address"] else ""
    
-    lines = [l.strip().replace('"', '').strip(", ") for l in raw_text.split("\n") if l.strip()]
+    lines = doc.name_lines
 
     # CARD DOCUMENT DETECTION
     def is_card_document(lines):
         short_lines = sum(1 for l in lines if 3 < len(l) < 40)
-        id_like = any(re.search(r"\b\d{4}[\s-]?\d{4}\b|\b[A-Z]{2,}\d{4,}\b", l) for l in lines)
+        id_like = any(CARD_ID_REGEX.search(l) for l in lines)
         return short_lines >= 4 and id_like
 
     card_doc = is_card_document(lines)
 
     # NAME EXTRACTION
    
-    name_anchors = ["NAME", "APPLICANT", "NOMINEE", "HOLDER"]
-    identity_keywords = ["DOB", "DATE OF BIRTH", "BIRTH", "SEX", "GENDER", "VALID", "ISSUE", "EXPIRY"]
-
-    blacklist = [
-        "INDIA", "GOVT", "INCOME", "TAX", "UNIQUE", "AUTHORITY",
-        "FATHER", "MOTHER", "MALE", "FEMALE"
-    ]
-    blacklist.extend([s.upper() for s in INDIAN_STATES])
+    kinds = doc.name_line_kinds
 
     #Anchor-based
     for i, line in enumerate(lines):
-        upper = line.upper()
-
-        if any(kw in upper for kw in ADDRESS_KEYWORDS):
+        if "address" in kinds[i]:
             continue
 
-        if any(anchor in upper for anchor in name_anchors):
-            val = re.split(r"NAME|APPLICANT|NOMINEE|HOLDER", line, flags=re.IGNORECASE)[-1].strip(" :-")
+        if "anchor" in kinds[i]:
+            val = NAME_ANCHOR_SPLIT_REGEX.split(line)[-1].strip(" :-")
             if len(val) < 3 and i + 1 < len(lines):
                 val = lines[i + 1].strip()
 
             if (
                 3 < len(val) < 35
                 and not any(c.isdigit() for c in val)
-                and val.upper() not in blacklist
+                and val.upper() not in NAME_BLACKLIST
                 and val.lower() not in address_lc
             ):
                 detected_names.append(val.title())
@@ -421,29 +865,32 @@ def extract_pii_hybrid(text: str) -> Dict:
     #Card neighborhood
     if card_doc:
         for i, line in enumerate(lines):
-            if any(k in line.upper() for k in identity_keywords):
-                window = lines[max(0, i - 3): min(len(lines), i + 2)]
-                for w in window:
+            if "identity" in kinds[i]:
+                lo = max(0, i - 3)
+                for j, w in enumerate(lines[lo: min(len(lines), i + 2)], start=lo):
                     w_clean = w.strip()
                     if (
                         3 < len(w_clean) < 35
                         and not any(c.isdigit() for c in w_clean)
-                        and w_clean.upper() not in blacklist
-                        and not any(kw in w_clean.upper() for kw in ADDRESS_KEYWORDS)
+                        and w_clean.upper() not in NAME_BLACKLIST
+                        and "address" not in kinds[j]
                     ):
                         detected_names.append(w_clean.title())
 
     #spaCy
-    doc = nlp(raw_text)
-    for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            name = ent.text.strip().title()
-            if (
-                len(name.split()) >= 2
-                and name.upper() not in blacklist
-                and name.lower() not in address_lc
-            ):
-                detected_names.append(name)
+    if ner_cache is not None and raw_text in ner_cache:
+        persons = ner_cache[raw_text]
+    else:
+        persons = person_entities(raw_text)
+
+    for ent_text in persons:
+        name = ent_text.strip().title()
+        if (
+            len(name.split()) >= 2
+            and name.upper() not in NAME_BLACKLIST
+            and name.lower() not in address_lc
+        ):
+            detected_names.append(name)
 
 
     def merge_consecutive(lines):
@@ -468,35 +915,53 @@ def extract_pii_hybrid(text: str) -> Dict:
     # OCR FALLBACK
 
     if not detected_names:
-        detected_names.extend(extract_name_from_ocr_lines(lines))
+        detected_names.extend(extract_name_from_ocr_lines(lines, kinds))
 
     results["names"] = list(dict.fromkeys(detected_names))[:1]
 
     return results
 
-def multi_user_grouping(text: str) -> List[Dict]:
-
-    blocks = re.split(r"(?i)Applicant\s+\d+", text)
+def split_user_blocks(text: str) -> List[str]:
+    blocks = APPLICANT_SPLIT_REGEX.split(text)
 
     if len(blocks) == 1:
         blocks = [text]
 
+    return blocks
+
+
+def user_block_documents(text: str) -> List[Tuple[str, Optional[DocumentText]]]:
+    # (block, cleaned DocumentText) per user block; None for blocks too short
+    # to be looked at
+    return [
+        (block, DocumentText(clean_text_global(block)) if len(block.strip()) > 30 else None)
+        for block in split_user_blocks(text)
+    ]
+
+
+def multi_user_grouping(text: str, ner_cache: Optional[Dict[str, List[str]]] = None, block_docs=None) -> List[Dict]:
+
+    if block_docs is None:
+        block_docs = user_block_documents(text)
+
     user_list = []
-    for block in blocks:
-        if len(block.strip()) > 30:
-           entities = extract_pii_hybrid(block)
+    for block, doc in block_docs:
+        if doc is None:
+            # too short to hold a user
+            continue
+        entities = extract_pii_hybrid(doc, ner_cache)
 
         # Only accept if strong ID exists
-           has_strong_id = bool(
+        has_strong_id = bool(
             entities.get("aadhaar") 
             or entities.get("pan")
             or entities.get("dl")
             or entities.get("voter_id")
         )
 
-           if not has_strong_id:
-             continue
-           
+        if not has_strong_id:
+            continue
+
         if entities.get("names"):
             addr = extract_address_near_name(block, entities["names"][0])
             if addr:
@@ -511,111 +976,1470 @@ def multi_user_grouping(text: str) -> List[Dict]:
     return user_list
 
 
-def process_document(file_path: str):
-  
-    dtype = identify_file(file_path)
-    filename = os.path.basename(file_path)
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf', '.docx', '.xlsx', '.xls')
+
+# Part of every result-cache key: bump ENGINE_VERSION whenever extraction
+# output changes, OCR_VERSION whenever rasterization / preprocessing code
+# changes. PII_OCR_BACKEND, PII_OCR_LANG and the other PII_OCR_* /
+# PII_PREPROCESS settings are part of the key already (ocr_settings).
+ENGINE_VERSION = "1.6"
+OCR_VERSION = "5"
+
+# Pages handed to one worker task when a file has no OCR work (Excel rows, text PDFs)
+PAGE_CHUNK_SIZE = 64
+
 
+# OCR BACKENDS
+# PII_OCR_BACKEND selects the engine: "tesserocr" keeps one libtesseract
+# handle per worker thread alive and feeds it raw pixel buffers; "pytesseract"
+# spawns the tesseract CLI per image; "auto" (default) uses tesserocr when it
+# is installed and usable (it needs tessdata for PII_OCR_LANG) and falls back
+# to pytesseract otherwise.
+
+OCR_BACKEND = os.getenv("PII_OCR_BACKEND", "auto")
+OCR_LANG = os.getenv("PII_OCR_LANG", "eng")
+
+if OCR_BACKEND in ("auto", "tesserocr"):
+    # tesserocr's first import has to happen on the main thread (it installs
+    # a signal handler); once it is loaded, request threads can create the
+    # backend too
     try:
-        pages = []
-
-        if dtype == DocType.DOCX:
-            doc = Document(file_path)
-            text = "\n".join(p.text for p in doc.paragraphs)
-            pages.append((1, text))
-
-        elif dtype == DocType.PDF:
-            with fitz.open(file_path) as doc:
-                for i, page in enumerate(doc, start=1):
-                    text = page.get_text().strip()
-                    if not text:
-                        pix = page.get_pixmap(matrix=fitz.Matrix(300 / 72, 300 / 72))
-                        import numpy as np
-                        img = cv2.imdecode(
-                            np.frombuffer(pix.tobytes(), np.uint8),
-                            cv2.IMREAD_COLOR
-                        )
-                        text = pytesseract.image_to_string(
-                            production_preprocess(img),
-                            config="--psm 3"
-                        )
-                    pages.append((i, text))
-
-
-        elif dtype == DocType.IMAGE:
-            img = cv2.imread(file_path)
-            text = pytesseract.image_to_string(
-                production_preprocess(img),
-                config="--psm 3"
-            )
-            pages.append((1, text))
-
-
-        elif dtype == DocType.EXCEL:
-            df = pd.read_excel(file_path)
-            pages = [(i + 1, row.to_string()) for i, row in df.iterrows()]
+        import tesserocr  # noqa: F401
+    except Exception:
+        pass
 
-        else:
-            return {"status": "error", "message": "Unsupported file format"}
 
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def image_to_string(self, image, psm: int = 3) -> str:
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=f"--psm {psm}")
+
+    def recognize(self, image, psm: int = 3) -> Tuple[str, float]:
+        # (text, mean word confidence 0-100) from a single tesseract run
+        data = pytesseract.image_to_data(
+            image, lang=OCR_LANG, config=f"--psm {psm}",
+            output_type=pytesseract.Output.DICT,
+        )
+        lines, confs = {}, []
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            if conf < 0 or not word.strip():
+                continue
+            confs.append(conf)
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+        text = "\n".join(" ".join(words) for words in lines.values())
+        return text, (sum(confs) / len(confs) if confs else 0.0)
+
+    def ocr_lines(self, image, lines, psm: int = 6) -> str:
+        # One tesseract process for all regions: every line of boxes is
+        # pasted side by side, the lines stacked, and the sheet OCR'd at once.
+        gap = 24
         rows = []
+        for boxes in lines:
+            height = max(h for _, _, _, h in boxes)
+            row = np.full((height, sum(w for _, _, w, _ in boxes) + gap * (len(boxes) - 1)), 255, np.uint8)
+            left = 0
+            for x, y, w, h in boxes:
+                row[:h, left:left + w] = image[y:y + h, x:x + w]
+                left += w + gap
+            rows.append(row)
+        width = max(r.shape[1] for r in rows) + 2 * gap
+        sheet = np.full((sum(r.shape[0] + gap for r in rows) + gap, width), 255, np.uint8)
+        top = gap
+        for r in rows:
+            sheet[top:top + r.shape[0], gap:gap + r.shape[1]] = r
+            top += r.shape[0] + gap
+        return self.image_to_string(sheet, psm)
+
+
+class TesserocrBackend:
+    name = "tesserocr"
+
+    def __init__(self, lang: str = OCR_LANG):
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.lang = lang
+        self._local = threading.local()
+
+    def api(self):
+        # Created lazily in the thread (and process) that uses it; a handle
+        # inherited through fork is never reused.
+        api = getattr(self._local, "api", None)
+        if api is None or self._local.pid != os.getpid():
+            api = self.tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api, self._local.pid = api, os.getpid()
+        return api
+
+    def image_to_string(self, image, psm: int = 3) -> str:
+        api = self.api()
+        api.SetPageSegMode(psm)
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bpp = 1 if image.ndim == 2 else image.shape[2]
+        if bpp == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        api.SetImageBytes(image.tobytes(), width, height, bpp, width * bpp)
+        return api.GetUTF8Text()
+
+    def recognize(self, image, psm: int = 3) -> Tuple[str, float]:
+        text = self.image_to_string(image, psm)
+        return text, float(self.api().MeanTextConf())
+
+    def ocr_lines(self, image, lines, psm: int = 7) -> str:
+        # The image is handed to tesseract once; each box is then just a
+        # SetRectangle on it, OCR'd as a single text line.
+        api = self.api()
+        image = np.ascontiguousarray(image)
+        height, width = image.shape
+        api.SetImageBytes(image.tobytes(), width, height, 1, width)
+        api.SetPageSegMode(psm)
+        out = []
+        for boxes in lines:
+            words = []
+            for x, y, w, h in boxes:
+                api.SetRectangle(x, y, w, h)
+                words.append(api.GetUTF8Text().strip())
+            out.append(" ".join(w for w in words if w))
+        return "\n".join(out)
+
+
+_ocr_backend = None
+
+
+def create_ocr_backend(name: str = OCR_BACKEND):
+    if name == "pytesseract":
+        return PytesseractBackend()
+    if name == "tesserocr":
+        return TesserocrBackend()
+    if name != "auto":
+        raise ValueError(f"Unknown OCR backend: {name}")
+    try:
+        backend = TesserocrBackend()
+        backend.api()  # fails without tessdata for OCR_LANG
+    except ModuleNotFoundError:
+        logger.info("OCR backend: pytesseract (tesserocr is not installed)")
+        return PytesseractBackend()
+    except Exception as e:
+        logger.warning("OCR backend: pytesseract (tesserocr is not usable: %s)", e)
+        return PytesseractBackend()
+    logger.info("OCR backend: tesserocr")
+    return backend
+
+
+def get_ocr_backend():
+    global _ocr_backend
+    if _ocr_backend is None:
+        _ocr_backend = create_ocr_backend()
+    return _ocr_backend
+
+
+def ocr_image(img) -> str:
+    image = production_preprocess(img)
+    with metrics.stage("ocr"):
+        return get_ocr_backend().image_to_string(image, psm=3)
+
+
+# ID CARD IMAGES
+# Photos of Aadhaar / PAN / DL cards are mostly background. The card is
+# located and deskewed, its text lines are boxed with a morphological
+# gradient, and only those boxes are OCR'd (one batched call per image).
+# Anything that does not look like a card (no boxes, too many boxes, no text
+# read) falls back to whole-image OCR.
+
+OCR_IMAGE_ROI = os.getenv("PII_OCR_IMAGE_ROI", "1") == "1"
+ROI_DETECT_SIDE = 1000          # detection runs on a copy at most this large
+CARD_MIN_AREA_FRACTION = 0.15   # smallest card, as a share of the photo
+ROI_MAX_REGIONS = 40            # more boxes than this is a document, not a card
+ROI_PAD = 4
+
+
+def _detect_copy(gray):
+    scale = min(1.0, ROI_DETECT_SIDE / max(gray.shape))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def crop_card(gray):
+    # Deskewed crop of the card if one stands out from the background,
+    # otherwise the image unchanged.
+    small, scale = _detect_copy(gray)
+    edges = cv2.dilate(cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150), np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+    card = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(card) < CARD_MIN_AREA_FRACTION * small.size:
+        return gray
+
+    (cx, cy), (w, h), angle = cv2.minAreaRect(card)
+    if angle > 45:
+        angle -= 90
+        w, h = h, w
+    cx, cy, w, h = cx / scale, cy / scale, w / scale, h / scale
+    if w * h > 0.95 * gray.size:
+        return gray  # the photo is already just the card
+
+    if abs(angle) > 0.5:
+        m = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+        gray = cv2.warpAffine(gray, m, (gray.shape[1], gray.shape[0]), flags=cv2.INTER_LINEAR, borderValue=255)
+    return cv2.getRectSubPix(gray, (int(w), int(h)), (cx, cy))
+
+
+def find_text_lines(gray) -> List[List[Tuple[int, int, int, int]]]:
+    # Text boxes (x, y, w, h) in full-resolution coordinates, grouped into
+    # lines top to bottom and ordered left to right within a line.
+    small, scale = _detect_copy(gray)
+    grad = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    _, bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # drop the card edge so it cannot chain every line into one contour
+    m = max(2, min(bw.shape) // 50)
+    bw[:m], bw[-m:], bw[:, :m], bw[:, -m:] = 0, 0, 0, 0
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, small.shape[1] // 40), 1))
+    contours, _ = cv2.findContours(cv2.morphologyEx(bw, cv2.MORPH_CLOSE, kernel), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        # text lines are wider than tall, not huge (photos, emblems), not specks
+        if h < 6 or w < h or h > small.shape[0] * 0.2:
+            continue
+        if cv2.countNonZero(bw[y:y + h, x:x + w]) < 0.2 * w * h:
+            continue
+        x0 = max(int(x / scale) - ROI_PAD, 0)
+        y0 = max(int(y / scale) - ROI_PAD, 0)
+        x1 = min(int((x + w) / scale) + ROI_PAD, gray.shape[1])
+        y1 = min(int((y + h) / scale) + ROI_PAD, gray.shape[0])
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+
+    lines = []
+    for box in sorted(boxes, key=lambda b: b[1] + b[3] / 2):
+        center = box[1] + box[3] / 2
+        if lines and lines[-1][0][1] <= center <= lines[-1][0][1] + lines[-1][0][3]:
+            lines[-1].append(box)
+        else:
+            lines.append([box])
+    return [sorted(line) for line in lines]
+
+
+def ocr_id_image(img) -> str:
+    return memo_ocr(("id_image", OCR_IMAGE_ROI, image_digest(img)), lambda: _ocr_id_image(img))
+
+
+def _ocr_id_image(img) -> str:
+    if not OCR_IMAGE_ROI:
+        return ocr_image(img)
+
+    with metrics.stage("roi_detect"):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        card = crop_card(gray)
+        lines = find_text_lines(card)
+    if not lines or sum(len(line) for line in lines) > ROI_MAX_REGIONS:
+        return ocr_image(img)
+
+    binary = production_preprocess(card, deskew=False)
+    with metrics.stage("ocr"):
+        text = get_ocr_backend().ocr_lines(binary, lines)
+    return text if text.strip() else ocr_image(img)
+
+
+OCR_DPI = 300
+
+
+def render_page_gray(page, dpi: int = OCR_DPI, clip=None):
+    # Renders straight to 8-bit grayscale and returns (image, pix): image is a
+    # NumPy view over the pixmap's own sample buffer (no PNG encode/decode, no
+    # copy), so pix must stay referenced for as long as image is used.
+    with metrics.stage("rasterize"):
+        pix = page.get_pixmap(
+            matrix=fitz.Matrix(dpi / 72, dpi / 72),
+            colorspace=fitz.csGRAY,
+            alpha=False,
+            clip=clip,
+        )
+    image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return image[:, :pix.width], pix
+
+
+# DUPLICATE IMAGES
+# Packets repeat the same scanned annexure or ID card image. OCR results are
+# remembered per worker process, keyed by a digest of the exact pixels about
+# to be OCR'd, so an identical image costs one hash instead of an OCR pass.
+# Only byte-identical renders match, so the text is always what OCR would
+# have returned.
+
+DEDUP_IMAGES = os.getenv("PII_DEDUP_IMAGES", "1") == "1"
+OCR_MEMO_ENTRIES = 256
+
+_ocr_memo = OrderedDict()
+_ocr_memo_lock = threading.Lock()
+
+
+def image_digest(image) -> bytes:
+    digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16)
+    digest.update(repr(image.shape).encode())
+    return digest.digest()
+
+
+def clear_ocr_memo():
+    with _ocr_memo_lock:
+        _ocr_memo.clear()
+
+
+def memo_ocr(key, run):
+    # run() unless an identical image was already OCR'd in this process
+    if not DEDUP_IMAGES:
+        return run()
+    with _ocr_memo_lock:
+        if key in _ocr_memo:
+            _ocr_memo.move_to_end(key)
+            metrics.count("dedup_images")
+            return _ocr_memo[key]
+    result = run()
+    with _ocr_memo_lock:
+        _ocr_memo[key] = result
+        if len(_ocr_memo) > OCR_MEMO_ENTRIES:
+            _ocr_memo.popitem(last=False)
+    return result
+
+
+# PAGE TRIAGE
+# Decides per PDF page what actually needs OCR:
+#  - text layer and no unread images      -> use the text layer
+#  - no text layer and (almost) no ink    -> blank, skip
+#  - no text layer                        -> OCR the whole page
+#  - text layer plus images without text  -> text layer + OCR of those images
+# OCR starts at the lowest of OCR_DPI_STEPS and moves up a step only while
+# the engine's mean confidence stays under OCR_MIN_CONFIDENCE.
+
+OCR_DPI_STEPS = tuple(int(d) for d in os.getenv("PII_OCR_DPI_STEPS", "150,300").split(","))
+OCR_MIN_CONFIDENCE = float(os.getenv("PII_OCR_MIN_CONFIDENCE", "75"))
+OCR_MIXED_PAGES = os.getenv("PII_OCR_MIXED_PAGES", "1") == "1"
+BLANK_CHECK_DPI = 50
+BLANK_INK_RATIO = 0.001
+# images smaller than this share of the page (logos, stamps) are not OCR'd
+OCR_MIN_REGION_FRACTION = 0.02
+
+
+def is_blank_page(page) -> bool:
+    image, pix = render_page_gray(page, BLANK_CHECK_DPI)
+    return np.count_nonzero(image < 200) / image.size < BLANK_INK_RATIO
+
+
+def unread_image_regions(page) -> list:
+    # placed images big enough to matter that have no text layer over them
+    page_area = abs(page.rect)
+    regions = []
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page.rect
+        if rect.is_empty or abs(rect) < page_area * OCR_MIN_REGION_FRACTION:
+            continue
+        if page.get_text(clip=rect).strip():
+            continue
+        regions.append(rect)
+    return regions
+
+
+def triage_page(page) -> Tuple[str, str, list]:
+    # (kind, text_layer, regions) with kind "text", "blank" or "ocr"
+    text = page.get_text().strip()
+    if text:
+        regions = unread_image_regions(page) if OCR_MIXED_PAGES else []
+        return ("ocr", text, regions) if regions else ("text", text, [])
+    if is_blank_page(page):
+        return "blank", "", []
+    return "ocr", "", [None]  # None = whole page
+
+
+def ocr_page_region(page, clip=None) -> str:
+    text = ""
+    for dpi in OCR_DPI_STEPS:
+        image, pix = render_page_gray(page, dpi, clip)
+
+        def run():
+            binary = production_preprocess(image)
+            with metrics.stage("ocr"):
+                return get_ocr_backend().recognize(binary, psm=3)
+
+        text, confidence = memo_ocr(("page", dpi, image_digest(image)), run)
+        if confidence >= OCR_MIN_CONFIDENCE:
+            break
+    return text
+
+
+def ocr_pdf_page(page, plan=None) -> str:
+    kind, text, regions = plan or triage_page(page)
+    if kind != "ocr":
+        return text
+
+    parts = [text] if text else []
+    parts.extend(ocr_page_region(page, clip) for clip in regions)
+    return "\n".join(parts)
+
+
+# RESULT CACHE
+
+def ocr_settings() -> str:
+    # everything that changes the text OCR reads from a page. Built from the
+    # configured backend, not get_ocr_backend(): keys are needed for DOCX and
+    # XLSX too, and creating a backend imports tesserocr, which fails off the
+    # main thread.
+    dpi = ",".join(str(d) for d in OCR_DPI_STEPS)
+    return (
+        f"{OCR_VERSION}:{OCR_BACKEND}:{OCR_LANG}:{PREPROCESS_MODE}:{dpi}:{OCR_MIN_CONFIDENCE:g}"
+        f":mixed{int(OCR_MIXED_PAGES)}:roi{int(OCR_IMAGE_ROI)}"
+    )
+
+
+def extraction_version() -> str:
+    # everything that changes the rows a file produces
+    near = f":near{DEDUP_NEAR_THRESHOLD}" if DEDUP_NEAR else ""
+    return f"{ENGINE_VERSION}:{EXCEL_ENGINE}:{SPACY_MODEL}:docx{DOCX_CHUNK_CHARS}:{ocr_settings()}{near}"
+
+
+def rows_cache_key(file_hash: str) -> str:
+    return f"{file_hash}:{extraction_version()}"
+
+
+def cached_ocr(file_hash: Optional[str], page_no: int, run) -> str:
+    # OCR text of one page, served from the result cache when possible
+    cache = get_default_cache() if file_hash else None
+    if cache is None:
+        metrics.count("ocr_pages")
+        return run()
+
+    key = f"{file_hash}:{page_no}:{ocr_settings()}"
+    text = cache.get("ocr", key)
+    if text is None:
+        metrics.count("ocr_pages")
+        text = run()
+        cache.put("ocr", key, text)
+    else:
+        metrics.count("ocr_cache_hits")
+    return text
+
+
+def cached_rows(file_path) -> Tuple[Optional[str], Optional[List[Dict]]]:
+    # (file_hash, rows) where rows is None on a miss and file_hash is None
+    # when caching is disabled. Cached rows carry this upload's file name.
+    cache = get_default_cache()
+    if cache is None:
+        return None, None
+
+    with metrics.stage("cache"):
+        file_hash = source_sha256(file_path)
+        rows = cache.get("rows", rows_cache_key(file_hash))
+    metrics.count("cache_misses" if rows is None else "cache_hits")
+    if rows is not None:
+        filename = source_name(file_path)
+        rows = [dict(r, file_name=filename) for r in rows]
+    return file_hash, rows
+
+
+def store_rows(file_hash: Optional[str], rows: List[Dict]):
+    cache = get_default_cache() if file_hash else None
+    if cache is not None:
+        cache.put("rows", rows_cache_key(file_hash), rows)
+
+
+# DOCX
+# word/document.xml is streamed with iterparse instead of loading the whole
+# document through python-docx, so memory stays flat on long contracts and the
+# first chunk is extracted before the rest of the file is parsed.
+#  - body text is cut into chunks at page and section breaks, and every
+#    DOCX_CHUNK_CHARS characters at the latest
+#  - a table whose first row names PII columns ("Name | PAN | Mobile") is a
+#    record table: every further row is a chunk of its own, written as
+#    "Header: value" lines. Other tables (label / value forms) are read row
+#    by row into the body text
+#  - header and footer text (each distinct text once) is added to the end of
+#    the first body text chunk rather than becoming a chunk of its own, so a
+#    "Confidential" header is not read as a page with a name on it (it is a
+#    chunk only when the body has no text)
+# A chunk is what a page is for the rest of the pipeline; page_number counts
+# chunks.
+
+DOCX_CHUNK_CHARS = int(os.getenv("PII_DOCX_CHUNK_CHARS", "20000"))
+DOCX_BODY_PART = "word/document.xml"
+DOCX_HEADER_FOOTER_REGEX = re.compile(r"word/(?:header|footer)\d*\.xml")
+DOCX_RECORD_HEADER_REGEX = re.compile(
+    r"(?i)\b(name|applicant|holder|customer|employee|address|dob|d\.o\.b|birth|pan|aadhaa?r|uid|"
+    r"mobile|phone|contact|e-?mail|voter|epic|licen[cs]e|dl)\b"
+)
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_T, W_TAB, W_BR, W_CR = _W + "p", _W + "t", _W + "tab", _W + "br", _W + "cr"
+W_TBL, W_TR, W_TC = _W + "tbl", _W + "tr", _W + "tc"
+W_SECT_PR, W_RENDERED_BREAK = _W + "sectPr", _W + "lastRenderedPageBreak"
+W_TYPE = _W + "type"
+# text boxes are stored twice, as DrawingML and as a VML fallback
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+# everything else (runs, properties, drawings) is skipped by the parser
+DOCX_TAGS = (W_P, W_T, W_TAB, W_BR, W_CR, W_TBL, W_TR, W_TC, W_SECT_PR, W_RENDERED_BREAK, MC_FALLBACK)
+
+
+class _DocxTable:
+    __slots__ = ("header", "record", "row", "cell", "lines")
+
+    def __init__(self):
+        self.header = None   # first row's cells
+        self.record = False
+        self.row = []        # cells of the current row
+        self.cell = []       # paragraphs of the current cell
+        self.lines = []      # rendered rows, only kept for nested tables
+
+
+def is_record_header(cells: List[str]) -> bool:
+    if len(cells) < 2 or not all(cells) or any(c.isdigit() for cell in cells for c in cell):
+        return False
+    return sum(1 for cell in cells if DOCX_RECORD_HEADER_REGEX.search(cell)) >= 2
+
+
+def render_record(header: List[str], cells: List[str]) -> str:
+    return "\n".join(
+        f"{label.rstrip(': ')}: {value}" if label else value
+        for label, value in zip_longest(header, cells, fillvalue="")
+        if value
+    )
+
+
+def render_form_row(cells: List[str]) -> str:
+    cells = [c for c in cells if c]
+    if len(cells) == 2:
+        # "Name | Ravi Kumar"
+        return f"{cells[0].rstrip(': ')}: {cells[1]}"
+    return "\t".join(cells)
+
+
+def _drop_finished(elem):
+    # frees a finished block and the ones before it; the parser keeps
+    # appending to the parent
+    elem.clear(keep_tail=True)
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def _iter_docx_part(source):
+    # ("line", text), ("record", text) and ("break", None) in document order
+    paragraphs = []   # open paragraphs; text box paragraphs nest in runs
+    tables = []
+    page_break = False
+    fallback = 0
+
+    for event, elem in etree.iterparse(source, events=("start", "end"), tag=DOCX_TAGS):
+        tag = elem.tag
+        if event == "start":
+            if tag == MC_FALLBACK:
+                fallback += 1
+            elif fallback:
+                pass
+            elif tag == W_P:
+                paragraphs.append([])
+            elif tag == W_TBL:
+                tables.append(_DocxTable())
+            continue
+
+        if tag == MC_FALLBACK:
+            fallback -= 1
+            continue
+        if fallback:
+            continue
+
+        if tag == W_T:
+            paragraphs[-1].append(elem.text or "")
+        elif tag == W_TAB:
+            if paragraphs:
+                paragraphs[-1].append("\t")
+        elif tag == W_BR and elem.get(W_TYPE) != "page" or tag == W_CR:
+            paragraphs[-1].append("\n")
+        elif tag in (W_BR, W_RENDERED_BREAK):
+            # page break: text before it stays on the previous chunk
+            if not tables and len(paragraphs) == 1:
+                text = "".join(paragraphs[-1]).strip()
+                if text:
+                    yield "line", text
+                paragraphs[-1] = []
+                yield "break", None
+        elif tag == W_SECT_PR:
+            # a paragraph's sectPr ends its section after the paragraph
+            if not tables and not paragraphs:
+                yield "break", None
+            elif not tables:
+                page_break = True
+
+        elif tag == W_P:
+            text = "".join(paragraphs.pop()).strip()
+            if tables:
+                if text:
+                    tables[-1].cell.append(text)
+            else:
+                if text:
+                    yield "line", text
+                if page_break and not paragraphs:
+                    yield "break", None
+                    page_break = False
+                if not paragraphs:
+                    _drop_finished(elem)
+
+        elif tag == W_TC:
+            table = tables[-1]
+            table.row.append(" ".join(table.cell))
+            table.cell = []
+
+        elif tag == W_TR:
+            table = tables[-1]
+            cells, table.row = table.row, []
+            if len(tables) == 1:
+                _drop_finished(elem)
+            if table.header is None:
+                table.header = cells
+                table.record = len(tables) == 1 and is_record_header(cells)
+                if table.record:
+                    continue
+            if table.record:
+                text = render_record(table.header, cells)
+                if text:
+                    yield "record", text
+            elif any(cells):
+                line = render_form_row(cells)
+                if len(tables) == 1:
+                    yield "line", line
+                else:
+                    table.lines.append(line)
+
+        elif tag == W_TBL:
+            table = tables.pop()
+            if tables:
+                tables[-1].cell.extend(table.lines)
+            elif not paragraphs:
+                _drop_finished(elem)
+
+
+def _docx_header_footer_text(zf: zipfile.ZipFile, names) -> str:
+    # distinct header / footer texts, headers first
+    parts = sorted((n for n in names if DOCX_HEADER_FOOTER_REGEX.fullmatch(n)), key=lambda n: ("footer" in n, n))
+    texts = []
+    for part in parts:
+        with zf.open(part) as source:
+            text = "\n".join(text for kind, text in _iter_docx_part(source) if text)
+        if text and text not in texts:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def iter_docx_chunks(file_path):
+    with zipfile.ZipFile(source_file(file_path)) as zf:
+        names = set(zf.namelist())
+        extra = _docx_header_footer_text(zf, names)
+        lines, size = [], 0
+
+        if DOCX_BODY_PART in names:
+            with zf.open(DOCX_BODY_PART) as source:
+                for kind, text in _iter_docx_part(source):
+                    if kind == "line":
+                        lines.append(text)
+                        size += len(text) + 1
+                        if size < DOCX_CHUNK_CHARS:
+                            continue
+                    if lines:
+                        if extra:
+                            lines.append(extra)
+                            extra = ""
+                        yield "\n".join(lines)
+                        lines, size = [], 0
+                    if kind == "record":
+                        yield text
+
+        if extra:
+            lines.append(extra)
+        if lines:
+            yield "\n".join(lines)
+
+
+def iter_pages(file_path, dtype: str, ocr: bool = True, file_hash: Optional[str] = None):
+    # Pages of a DOCX / PDF / image as (page_no, text), read lazily.
+    # Spreadsheets are read by iter_excel_chunks.
+    # With ocr=False, pages that need OCR come back as (page_no, None) so
+    # the caller can schedule them elsewhere. With a file_hash, OCR text is
+    # looked up in / added to the result cache.
+    if dtype == DocType.DOCX:
+        chunks = iter_docx_chunks(file_path)
+        page_no = 0
+        while True:
+            with metrics.stage("docx_read"):
+                text = next(chunks, None)
+            if text is None:
+                break
+            page_no += 1
+            yield page_no, text
+
+    elif dtype == DocType.PDF:
+        with open_pdf(file_path) as doc:
+            for i, page in enumerate(doc, start=1):
+                with metrics.stage("pdf_text"):
+                    plan = triage_page(page)
+                text = plan[1]
+                if plan[0] == "ocr":
+                    text = cached_ocr(file_hash, i, lambda: ocr_pdf_page(page, plan)) if ocr else None
+                yield i, text
+
+    elif dtype == DocType.IMAGE:
+        text = cached_ocr(file_hash, 1, lambda: ocr_id_image(read_image(file_path))) if ocr else None
+        yield 1, text
+
+
+def read_image(file_path):
+    with metrics.stage("image_read"):
+        if isinstance(file_path, InMemoryFile):
+            return cv2.imdecode(np.frombuffer(file_path.data, np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(file_path)
+
+
+def load_pages(file_path, dtype: str, ocr: bool = True) -> List[Tuple[int, Optional[str]]]:
+    return list(iter_pages(file_path, dtype, ocr))
+
+
+def ocr_page(file_path, dtype: str, page_no: int, file_hash: Optional[str] = None) -> str:
+    def run():
+        if dtype == DocType.PDF:
+            with open_pdf(file_path) as doc:
+                return ocr_pdf_page(doc[page_no - 1])
+        return ocr_id_image(read_image(file_path))
+
+    return cached_ocr(file_hash, page_no, run)
+
+
+def extract_page_rows(filename: str, page_no: int, text: str, ner_cache=None, user_blocks=None, sheet_name: str = "") -> List[Dict]:
+    rows = []
+
+    if user_blocks is None:
+        user_blocks = multi_user_grouping(text, ner_cache)
+
+    # Fallback: single-user document
+    if not user_blocks:
+      user_blocks = [extract_pii_hybrid(text, ner_cache)]
+
+
+    for user_idx, pii in enumerate(user_blocks, start=1):
+        name=pii.get("names", [""])[0] if pii.get("names") else ""
+        occ = count_name_occurrence(name, text)
+        row = make_row(filename, page_no, name, occ if occ >0 else 1, pii, sheet_name)
+        if row:
+            rows.append(row)
+
+    return rows
+
+
+def make_row(filename: str, page_no: int, name: str, occurrence: int, pii: Dict, sheet_name: str = "") -> Optional[Dict]:
+    # None when the row carries no PII at all. PII fields are lists of
+    # strings (result_table.flat_row joins them for the JSON API).
+    row = {
+        "file_name": filename,
+        "user_name": name,
+        "page_number": page_no,
+        "sheet_name": sheet_name,
+        "occurrence": occurrence,
+    }
+    for field in LIST_FIELDS:
+        row[field] = list(pii.get(field, []))
+
+    if row["user_name"] or any(row[field] for field in LIST_FIELDS):
+        return row
+    return None
+
+
+# DUPLICATE PAGES
+# Packets and statements repeat boilerplate pages (terms, annexures, blank
+# forms) and spreadsheets repeat rows. extract_pages_batch extracts each
+# distinct page text once and copies its rows to the repeats with their own
+# page number. A PageDedup lives for one document when pages are extracted
+# in this process, and for one batch in a worker task.
+#
+# PII_DEDUP_NEAR also reuses rows for pages that are almost the same
+# (MinHash estimate of word 3-gram Jaccard >= PII_DEDUP_NEAR_THRESHOLD), but
+# only if both pages have exactly the same PII-looking tokens (anything with
+# a digit, a capital letter or an @) in the same order, so a filled form is
+# never matched with a blank one or with the same form filled for someone
+# else. The pages may still differ in lowercase words, so rows can differ
+# from a full extraction in rare cases; it is off by default.
+
+DEDUP_PAGES = os.getenv("PII_DEDUP", "1") == "1"
+DEDUP_NEAR = os.getenv("PII_DEDUP_NEAR", "0") == "1"
+DEDUP_NEAR_THRESHOLD = float(os.getenv("PII_DEDUP_NEAR_THRESHOLD", "0.9"))
+MINHASH_PERMUTATIONS = 64
+MINHASH_PRIME = (1 << 61) - 1
+
+_minhash_rng = np.random.default_rng(0)
+MINHASH_A = _minhash_rng.integers(1, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+MINHASH_B = _minhash_rng.integers(0, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+PLAIN_TOKEN_REGEX = re.compile(r"[a-z.,;:!?'\"()\[\]/&-]+")
+
+
+def minhash_signature(words: List[str]) -> "np.ndarray":
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    x = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((MINHASH_A[:, None] * x[None, :] + MINHASH_B[:, None]) % MINHASH_PRIME).min(axis=1)
+
+
+class _DedupSlot:
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = None   # rows of the first page with this text, once extracted
+
+
+class PageDedup:
+    def __init__(self, near: bool = DEDUP_NEAR):
+        self.exact = {}                                # text digest -> slot
+        self.near = defaultdict(list) if near else None  # PII skeleton digest -> [(signature, slot)]
+
+    def match(self, text: str) -> Tuple[_DedupSlot, Optional[str]]:
+        # (slot, how) where how is None for a new page, "exact" or "near"
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        slot = self.exact.get(key)
+        if slot is not None:
+            return slot, "exact"
+
+        if self.near is not None:
+            tokens = text.split()
+            skeleton = hashlib.blake2b(
+                "\x1f".join(t for t in tokens if not PLAIN_TOKEN_REGEX.fullmatch(t)).encode(), digest_size=16
+            ).digest()
+            signature = minhash_signature([t.lower() for t in tokens])
+            for other, slot in self.near[skeleton]:
+                if np.count_nonzero(signature == other) >= DEDUP_NEAR_THRESHOLD * MINHASH_PERMUTATIONS:
+                    self.exact[key] = slot
+                    return slot, "near"
+            slot = _DedupSlot()
+            self.near[skeleton].append((signature, slot))
+        else:
+            slot = _DedupSlot()
+
+        self.exact[key] = slot
+        return slot, None
+
+
+def extract_rows_batch(filename: str, pages, batch_size: Optional[int] = None, n_process: Optional[int] = None, sheet_name: str = "") -> List[Dict]:
+    # Same rows as extract_page_rows over each page, but the spaCy work for
+    # every block of every page goes through nlp.pipe in batches.
+    return [
+        row
+        for page_rows in extract_pages_batch(filename, pages, batch_size, n_process, sheet_name)
+        for row in page_rows
+    ]
+
+
+def extract_pages_batch(filename: str, pages, batch_size: Optional[int] = None, n_process: Optional[int] = None, sheet_name: str = "", dedup: Optional[PageDedup] = None) -> List[List[Dict]]:
+    # extract_rows_batch, with the rows kept apart per page
+    pages = list(pages)
+    if not DEDUP_PAGES:
+        return _extract_pages(filename, pages, batch_size, n_process, sheet_name)
+
+    # repeated pages are left out and get the rows of their first copy
+    dedup = dedup if dedup is not None else PageDedup()
+    slots, repeats = [], {}
+    for i, (_, text) in enumerate(pages):
+        if not text:
+            slots.append(None)
+            continue
+        slot, how = dedup.match(text)
+        slots.append(slot)
+        if how is not None:
+            repeats[i] = slot
+            metrics.count("dedup_pages" if how == "exact" else "dedup_near_pages")
+
+    fresh = [i for i in range(len(pages)) if i not in repeats]
+    for i, rows in zip(fresh, _extract_pages(filename, [pages[i] for i in fresh], batch_size, n_process, sheet_name)):
+        if slots[i] is not None:
+            slots[i].rows = rows
+
+    return [
+        [dict(row, page_number=pages[i][0]) for row in repeats[i].rows] if i in repeats
+        else slots[i].rows if slots[i] is not None else []
+        for i in range(len(pages))
+    ]
+
+
+def _extract_pages(filename: str, pages: List[Tuple[int, str]], batch_size: Optional[int] = None, n_process: Optional[int] = None, sheet_name: str = "") -> List[List[Dict]]:
+    # blank pages (empty text) still count as processed, they just have no rows
+    page_docs = [user_block_documents(text) if text else [] for _, text in pages]
+
+    ner_cache = batch_person_entities(
+        (doc.text for block_docs in page_docs for _, doc in block_docs if doc is not None),
+        batch_size,
+        n_process,
+    )
+
+    page_blocks = [
+        multi_user_grouping(text, ner_cache, block_docs) if text else []
+        for (_, text), block_docs in zip(pages, page_docs)
+    ]
+
+    # Pages with no accepted user block fall back to the whole page
+    fallback_docs = {
+        i: DocumentText(clean_text_global(text))
+        for i, ((_, text), blocks) in enumerate(zip(pages, page_blocks))
+        if text and not blocks
+    }
+    ner_cache.update(batch_person_entities(
+        (d.text for d in fallback_docs.values() if d.text not in ner_cache),
+        batch_size,
+        n_process,
+    ))
+    for i, doc in fallback_docs.items():
+        page_blocks[i] = [extract_pii_hybrid(doc, ner_cache)]
+
+    return [
+        extract_page_rows(filename, page_no, text, ner_cache, blocks, sheet_name) if text else []
+        for (page_no, text), blocks in zip(pages, page_blocks)
+    ]
+
+
+# COLUMNAR EXCEL ENGINE
+#
+# Spreadsheets are usually one person per row with one kind of value per
+# column. Each column is classified once from a sample of its values (and its
+# header for names / addresses / DOB), then whole columns are matched with
+# pandas .str methods instead of pushing every row through extract_pii_hybrid.
+# Unclassified text columns still get the structured ID scan.
+# PII_EXCEL_ENGINE=rows restores the per-row hybrid extractor.
+
+EXCEL_ENGINE = os.getenv("PII_EXCEL_ENGINE", "columnar")
+EXCEL_SAMPLE_SIZE = 200
+EXCEL_CLASSIFY_THRESHOLD = 0.6
+
+STRUCTURED_ID_REGEXES = {k: re.compile(v) for k, v in STRUCTURED_ID_PATTERNS.items()}
+STRUCTURED_ID_FULL_REGEXES = {k: re.compile(rf"\s*(?:{v})\s*") for k, v in STRUCTURED_ID_PATTERNS.items()}
 
-        for page_no, text in pages:
-            user_blocks = multi_user_grouping(text)
-
-            # Fallback: single-user document
-            if not user_blocks:
-              user_blocks = [extract_pii_hybrid(text)]
-
-
-            for user_idx, pii in enumerate(user_blocks, start=1):
-                name=pii.get("names", [""])[0] if pii.get("names") else ""
-                occ = count_name_occurrence(name, text)
-                row = {
-                    "file_name": filename,
-                    "user_name": name,
-                    "page_number": page_no,
-                    "occurrence": occ if occ >0 else 1,
-                    "phone": ", ".join(pii.get("phone", [])),
-                    "email": ", ".join(pii.get("email", [])),
-                    "aadhaar": ", ".join(pii.get("aadhaar", [])),
-                    "pan": ", ".join(pii.get("pan", [])),
-                    "address": ", ".join(pii.get("address", [])),
-                    "dl": ", ".join(pii.get("dl", [])),
-                    "voter_id": ", ".join(pii.get("voter_id", [])),
-                    "dob": ", ".join(pii.get("dob", [])),
-                }
-
-                if any(
-                    row[k]
-                    for k in row
-                    if k not in ("file_name", "page_number", "occurrence")
-                ):
-                    rows.append(row)
+NAME_HEADER_REGEX = re.compile(r"(?i)\b(name|applicant|holder|nominee|employee|customer)\b")
+NOT_NAME_HEADER_REGEX = re.compile(r"(?i)\b(father|mother|spouse|husband|guardian|company|branch|bank|file|sheet|user ?name|login)\b")
+ADDRESS_HEADER_REGEX = re.compile(r"(?i)\b(address|addr|residence)\b")
+DOB_HEADER_REGEX = re.compile(r"(?i)\b(dob|d\.o\.b|date of birth|birth ?date)\b")
+
+EXCEL_FIELDS = ("pan", "aadhaar", "voter_id", "dl", "phone", "email", "dob", "address")
+
+
+def _cell_str(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # numeric IDs / phone numbers come back from Excel as floats
+        return str(int(value))
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.strftime("%d/%m/%Y")
+    return str(value).strip()
+
+
+def _column_strings(series: "pd.Series") -> "pd.Series":
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%d/%m/%Y").fillna("")
+    return series.map(_cell_str)
+
+
+def classify_excel_columns(df: "pd.DataFrame") -> Dict[str, str]:
+    # {column: kind} where kind is a STRUCTURED_ID_PATTERNS key, "name",
+    # "address", "dob" or "text" (unclassified free text)
+    kinds = {}
+
+    for col in df.columns:
+        header = str(col)
+        values = _column_strings(df[col].head(EXCEL_SAMPLE_SIZE))
+        values = values[values != ""]
+        if values.empty:
+            continue
+
+        best_kind, best_score = None, 0.0
+        for kind, regex in STRUCTURED_ID_FULL_REGEXES.items():
+            score = sum(1 for v in values if regex.fullmatch(v)) / len(values)
+            if score > best_score:
+                best_kind, best_score = kind, score
+
+        if best_score >= EXCEL_CLASSIFY_THRESHOLD:
+            kinds[col] = best_kind
+        elif DOB_HEADER_REGEX.search(header):
+            kinds[col] = "dob"
+        elif ADDRESS_HEADER_REGEX.search(header):
+            kinds[col] = "address"
+        elif NAME_HEADER_REGEX.search(header) and not NOT_NAME_HEADER_REGEX.search(header):
+            alpha = sum(1 for v in values if not any(c.isdigit() for c in v)) / len(values)
+            kinds[col] = "name" if alpha >= EXCEL_CLASSIFY_THRESHOLD else "text"
+        elif not pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            kinds[col] = "text"
+
+    return kinds
+
+
+def _normalize_phones(found: List[str]) -> List[str]:
+    norm_phones = []
+    for p in found:
+        digits = NON_DIGIT_REGEX.sub("", p)
+        if len(digits) == 12 and digits.startswith("91"):
+            digits = digits[2:]
+        if len(digits) == 10:
+            norm_phones.append(digits)
+    return norm_phones
+
+
+def extract_excel_frame(filename: str, df: "pd.DataFrame", column_kinds: Dict[str, str], sheet_name: str = "") -> List[Dict]:
+    columns = {col: _column_strings(df[col]) for col in column_kinds}
+
+    # rows that are the same in every classified column are matched once
+    codes = None
+    if DEDUP_PAGES and columns and len(df) > 1:
+        values = list(columns.values())
+        key = values[0].str.cat(values[1:], sep="\x1f") if len(values) > 1 else values[0]
+        codes, uniques = pd.factorize(key)
+        if len(uniques) < len(df):
+            metrics.count("dedup_rows", len(df) - len(uniques))
+            first = np.unique(codes, return_index=True)[1]
+            columns = {col: v.iloc[first] for col, v in columns.items()}
+        else:
+            codes = None
+
+    n = len(df) if codes is None else len(first)
+    fields = {k: [[] for _ in range(n)] for k in EXCEL_FIELDS}
+    names = [""] * n
+
+    def add(field, matches):
+        for bucket, found in zip(fields[field], matches):
+            bucket.extend(found)
+
+    text_cols = []
+    for col, kind in column_kinds.items():
+        values = columns[col]
+
+        if kind in STRUCTURED_ID_REGEXES:
+            add(kind, values.str.findall(STRUCTURED_ID_REGEXES[kind]))
+        elif kind == "dob":
+            add("dob", values.str.findall(DOB_BARE_REGEX))
+        elif kind == "address":
+            add("address", values.str.replace(MULTI_SPACE_REGEX, " ", regex=True).map(lambda v: [v] if v else []))
+        elif kind == "name":
+            titled = values.str.strip().str.title()
+            for i, v in enumerate(titled):
+                if not names[i] and v and not any(c.isdigit() for c in v):
+                    names[i] = v
+        else:
+            text_cols.append(values)
+
+    if text_cols:
+        joined = text_cols[0]
+        for other in text_cols[1:]:
+            joined = joined.str.cat(other, sep="\n")
+        for i, hits in enumerate(joined.map(scan_structured_ids)):
+            for kind, _, _, value in hits:
+                fields[kind][i].append(value)
+
+    rows = []
+    for i, page_no in enumerate(df.index):
+        u = i if codes is None else codes[i]
+        pii = {k: list(dict.fromkeys(fields[k][u])) for k in EXCEL_FIELDS}
+        pii["phone"] = list(dict.fromkeys(_normalize_phones(pii["phone"])))
+        pii["dob"] = pii["dob"][:1]
+        row = make_row(filename, int(page_no) + 1, names[u], 1, pii, sheet_name)
+        if row:
+            rows.append(row)
+    return rows
+
+
+# STREAMING SPREADSHEET READER
+#
+# .xlsx sheets are walked with openpyxl in read-only mode and handed out as
+# DataFrames of at most EXCEL_CHUNK_ROWS rows, so memory does not grow with
+# the file. Every sheet is read. The DataFrame index is the 0-based data row
+# within its sheet (page_number = index + 1, as with pd.read_excel).
+# Legacy .xls has no streaming reader and is loaded per sheet.
+
+EXCEL_CHUNK_ROWS = int(os.getenv("PII_EXCEL_CHUNK_ROWS", "5000"))
+
+
+def _excel_columns(header) -> List[str]:
+    # same naming pandas uses for blank and repeated headers
+    columns, seen = [], defaultdict(int)
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if seen[name]:
+            columns.append(f"{name}.{seen[name]}")
+        else:
+            columns.append(name)
+        seen[name] += 1
+    return columns
+
+
+def _excel_frame(buffer, columns, start: int) -> "pd.DataFrame":
+    width = max(len(columns), max(len(r) for r in buffer))
+    if width > len(columns):
+        columns = columns + [f"Unnamed: {i}" for i in range(len(columns), width)]
+    data = [tuple(r) + (None,) * (width - len(r)) for r in buffer]
+    return pd.DataFrame(data, columns=columns, index=range(start, start + len(buffer)))
+
+
+def iter_excel_chunks(file_path, chunk_rows: Optional[int] = None):
+    # Yields (sheet_name, DataFrame) chunks in sheet order.
+    chunk_rows = chunk_rows or EXCEL_CHUNK_ROWS
+
+    if source_name(file_path).lower().endswith(".xls"):
+        for sheet_name, df in pd.read_excel(source_file(file_path), sheet_name=None).items():
+            for start in range(0, len(df), chunk_rows):
+                yield sheet_name, df.iloc[start:start + chunk_rows]
+        return
+
+    wb = openpyxl.load_workbook(source_file(file_path), read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            values = ws.iter_rows(values_only=True)
+            header = next(values, None)
+            if header is None:
+                continue
+            columns = _excel_columns(header)
+
+            buffer, start = [], 0
+            for row in values:
+                buffer.append(row)
+                if len(buffer) >= chunk_rows:
+                    yield ws.title, _excel_frame(buffer, columns, start)
+                    start += len(buffer)
+                    buffer = []
+            if buffer:
+                yield ws.title, _excel_frame(buffer, columns, start)
+    finally:
+        wb.close()
+
+
+def extract_excel_chunk(filename: str, sheet_name: str, df: "pd.DataFrame", column_kinds: Optional[Dict[str, str]], n_process: Optional[int] = None) -> List[Dict]:
+    # column_kinds is None for the per-row hybrid engine
+    with metrics.stage("excel_extract"):
+        if column_kinds is not None:
+            return extract_excel_frame(filename, df, column_kinds, sheet_name)
+
+        pages = ((i + 1, row.to_string()) for i, row in df.iterrows())
+        return extract_rows_batch(filename, pages, n_process=n_process, sheet_name=sheet_name)
+
+
+def iter_excel_tasks(file_path):
+    # (sheet_name, chunk, column_kinds); columns are classified on the first
+    # chunk of each sheet and reused for the rest of it
+    kinds_by_sheet = {}
+    chunks = iter_excel_chunks(file_path)
+    while True:
+        with metrics.stage("excel_read"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        sheet_name, df = chunk
+        metrics.count("sheet_rows", len(df))
+        column_kinds = None
+        if EXCEL_ENGINE == "columnar":
+            if sheet_name not in kinds_by_sheet:
+                kinds_by_sheet[sheet_name] = classify_excel_columns(df)
+            column_kinds = kinds_by_sheet[sheet_name]
+        yield sheet_name, df, column_kinds
+
+
+def iter_excel_rows(filename: str, file_path):
+    for sheet_name, df, column_kinds in iter_excel_tasks(file_path):
+        yield from extract_excel_chunk(filename, sheet_name, df, column_kinds)
+
+
+# STREAMING RESULTS
+#
+# Text-layer pages are cheap, so they are collected into NER batches; a batch
+# is flushed as soon as it holds PAGE_CHUNK_SIZE pages or has taken longer than
+# STREAM_FLUSH_SECONDS to read (in practice: right after an OCR'd page).
+
+STREAM_FLUSH_SECONDS = 0.5
+
+# Larger files are streamed without being added to the rows cache
+STREAM_CACHE_MAX_ROWS = 100_000
+
+
+def iter_document_pages(file_path, dtype: Optional[str] = None, file_hash: Optional[str] = None):
+    # Yields (pages_done, rows) each time a page finishes; a spreadsheet chunk
+    # counts as one page per sheet row. Errors propagate to the caller.
+    dtype = dtype or identify_file(file_path)
+    filename = source_name(file_path)
+
+    if file_hash is None and get_default_cache() is not None and dtype in (DocType.PDF, DocType.IMAGE):
+        file_hash = source_sha256(file_path)
+
+    metrics.count("documents")
+    metrics.count("bytes", source_size(file_path))
+
+    if dtype == DocType.EXCEL:
+        for sheet_name, df, column_kinds in iter_excel_tasks(file_path):
+            rows = extract_excel_chunk(filename, sheet_name, df, column_kinds)
+            metrics.count("rows", len(rows))
+            yield len(df), rows
+        return
+
+    if dtype not in (DocType.DOCX, DocType.PDF, DocType.IMAGE):
+        raise ValueError("Unsupported file format")
+
+    # repeated pages anywhere in the document are extracted once
+    dedup = PageDedup()
+    batch, started = [], time.perf_counter()
+    for page in iter_pages(file_path, dtype, file_hash=file_hash):
+        batch.append(page)
+        if len(batch) >= PAGE_CHUNK_SIZE or time.perf_counter() - started >= STREAM_FLUSH_SECONDS:
+            yield from _counted_pages(extract_pages_batch(filename, batch, dedup=dedup))
+            batch, started = [], time.perf_counter()
+
+    yield from _counted_pages(extract_pages_batch(filename, batch, dedup=dedup))
+
+
+def _counted_pages(page_rows_list):
+    for page_rows in page_rows_list:
+        metrics.count("pages")
+        metrics.count("rows", len(page_rows))
+        yield 1, page_rows
+
+
+def count_pages(file_path, dtype: Optional[str] = None) -> Optional[int]:
+    # Units iter_document_pages will report, without extracting anything.
+    # None when it cannot be known cheaply.
+    dtype = dtype or identify_file(file_path)
+
+    if dtype == DocType.PDF:
+        with open_pdf(file_path) as doc:
+            return doc.page_count
+    if dtype == DocType.IMAGE:
+        return 1
+    if dtype == DocType.EXCEL and not source_name(file_path).lower().endswith(".xls"):
+        wb = openpyxl.load_workbook(source_file(file_path), read_only=True)
+        try:
+            # max_row comes from the sheet's dimension record and can be missing
+            rows = [ws.max_row for ws in wb.worksheets]
+        finally:
+            wb.close()
+        if all(r is not None for r in rows):
+            return sum(max(r - 1, 0) for r in rows)
+    return None
+
+
+def iter_document_rows(file_path, dtype: Optional[str] = None, file_hash: Optional[str] = None):
+    for _, rows in iter_document_pages(file_path, dtype, file_hash):
+        yield from rows
+
+
+def process_document(file_path, metadata: bool = False):
+    # file_path: a path or an InMemoryFile
+    # metadata=True adds per-stage timings and counters under "metadata"
+    started = time.perf_counter()
+    with metrics.collect() as stage_metrics:
+        result = _process_document(file_path)
+    if metadata:
+        result["metadata"] = run_metadata(stage_metrics, started)
+    return result
+
+
+def _process_document(file_path):
+  
+    dtype = identify_file(file_path)
+    filename = source_name(file_path)
+
+    try:
+        if dtype not in (DocType.DOCX, DocType.PDF, DocType.IMAGE, DocType.EXCEL):
+            return {"status": "error", "message": "Unsupported file format"}
+
+        file_hash, rows = cached_rows(file_path)
+        if rows is None:
+            rows = list(iter_document_rows(file_path, dtype, file_hash))
+            store_rows(file_hash, rows)
 
         return {
             "status": "success",
             "rows": rows
         }
 
+    except ModelUnavailableError:
+        # configuration problem, not a bad file
+        raise
     except Exception as e:
         traceback.print_exc()
+        metrics.count("errors")
         return {"status": "failure", "error": str(e)}
 
 
+def run_metadata(stage_metrics: "metrics.StageMetrics", started: float) -> Dict:
+    return {"seconds": time.perf_counter() - started, **stage_metrics.as_dict()}
+
+
+# PARALLEL EXECUTION
+#
+# A task is (file_idx, file_path, dtype, pages, file_hash) where pages is a list of
+# (page_no, text) and text is None for pages that still need OCR. OCR pages
+# get a task of their own so one large scanned PDF spreads over all workers.
+# Spreadsheets are read in the parent and sent as (sheet_name, chunk,
+# column_kinds) instead of a page list. An InMemoryFile travels with each of
+# its tasks, so large files are better passed as paths.
 
-def run_pii_extraction(input_data):
+def _run_page_task(task):
+    # (file_idx, rows, error, metrics): the worker's stage metrics travel back
+    # with the result and are merged by _iter_parallel_results
+    with metrics.collect() as stage_metrics:
+        file_idx, rows, error = _extract_page_task(task)
+        metrics.count("rows", len(rows))
+    return file_idx, rows, error, stage_metrics.as_dict()
 
+
+def _extract_page_task(task):
+    file_idx, file_path, dtype, pages, file_hash = task
+    filename = source_name(file_path)
+
+    try:
+        if dtype == DocType.EXCEL:
+            sheet_name, df, column_kinds = pages
+            return file_idx, extract_excel_chunk(filename, sheet_name, df, column_kinds, n_process=1), None
+
+        metrics.count("pages", len(pages))
+        pages = [
+            (page_no, ocr_page(file_path, dtype, page_no, file_hash) if text is None else text)
+            for page_no, text in pages
+        ]
+        # already inside a worker process, so no nested spaCy pool
+        rows = extract_rows_batch(filename, pages, n_process=1)
+        return file_idx, rows, None
+
+    except Exception as e:
+        traceback.print_exc()
+        metrics.count("errors")
+        return file_idx, [], str(e)
+
+
+def _iter_page_tasks(files_to_process: List[str], file_hashes: Dict[int, str]):
+    # Yields (task, None) for work to submit, or (None, result) for a file
+    # whose result is already known (cache hit, read failure, or nothing to
+    # extract, e.g. an empty DOCX or a sheet with only a header row), so every
+    # supported file shows up in the results.
+    # file_hashes collects the hash of every file that missed the cache.
+    for file_idx, file_path in enumerate(files_to_process):
+        dtype = identify_file(file_path)
+        if dtype not in (DocType.DOCX, DocType.PDF, DocType.IMAGE, DocType.EXCEL):
+            continue
+
+        try:
+            file_hash, rows = cached_rows(file_path)
+            if rows is None:
+                metrics.count("documents")
+                metrics.count("bytes", source_size(file_path))
+        except Exception as e:
+            traceback.print_exc()
+            yield None, (file_idx, [], str(e))
+            continue
+        if rows is not None:
+            yield None, (file_idx, rows, None)
+            continue
+        if file_hash is not None:
+            file_hashes[file_idx] = file_hash
+
+        if dtype == DocType.EXCEL:
+            tasks = 0
+            try:
+                for excel_task in iter_excel_tasks(file_path):
+                    tasks += 1
+                    yield (file_idx, file_path, dtype, excel_task, file_hash), None
+            except Exception as e:
+                traceback.print_exc()
+                yield None, (file_idx, [], str(e))
+                continue
+            if not tasks:
+                yield None, (file_idx, [], None)
+            continue
+
+        chunk, pages = [], 0
+        try:
+            for page in iter_pages(file_path, dtype, ocr=False):
+                pages += 1
+                if page[1] is None:
+                    if chunk:
+                        yield (file_idx, file_path, dtype, chunk, file_hash), None
+                        chunk = []
+                    yield (file_idx, file_path, dtype, [page], file_hash), None
+                else:
+                    chunk.append(page)
+                    if len(chunk) >= PAGE_CHUNK_SIZE:
+                        yield (file_idx, file_path, dtype, chunk, file_hash), None
+                        chunk = []
+        except Exception as e:
+            traceback.print_exc()
+            yield None, (file_idx, [], str(e))
+            continue
+
+        if chunk:
+            yield (file_idx, file_path, dtype, chunk, file_hash), None
+        elif not pages:
+            yield None, (file_idx, [], None)
+
+
+def _iter_parallel_results(files_to_process: List[str], workers: int, file_hashes: Optional[Dict[int, str]] = None):
+    # Results come back in submission order (file order, then page order)
+    # while at most workers * 4 tasks are in flight.
+    pending = deque()
+    max_pending = workers * 4
+
+    preload_model()
+    mp_context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        for task, ready in _iter_page_tasks(files_to_process, {} if file_hashes is None else file_hashes):
+            if ready is not None:
+                pending.append(ready)
+                continue
+            pending.append(executor.submit(_run_page_task, task))
+
+            while len(pending) >= max_pending:
+                yield _task_result(pending.popleft())
+
+        while pending:
+            yield _task_result(pending.popleft())
+
+
+def _task_result(head):
+    if not isinstance(head, Future):
+        return head
+    file_idx, rows, error, task_metrics = head.result()
+    stage_metrics = metrics.current()
+    if stage_metrics is not None:
+        stage_metrics.merge(task_metrics)
+    return file_idx, rows, error
+
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = int(os.getenv("PII_WORKERS", "1"))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def collect_files(input_data, recursive: bool = False) -> List:
+    # Paths to extract (str or os.PathLike), plus any in-memory inputs
+    # (InMemoryFile, bytes, binary file objects) as InMemoryFile
     files_to_process = []
     # Normalize input
-   
-    if isinstance(input_data, str):
-        if os.path.isdir(input_data):
+    if isinstance(input_data, os.PathLike):
+        input_data = os.fsdecode(input_data)
+
+    if isinstance(input_data, (InMemoryFile, bytes, bytearray, memoryview)) or hasattr(input_data, "read"):
+        files_to_process.append(as_source(input_data))
+
+    elif isinstance(input_data, str):
+        if os.path.isdir(input_data) and recursive:
+            for dirpath, dirnames, filenames in os.walk(input_data):
+                dirnames.sort()
+                for f in sorted(filenames):
+                    if f.lower().endswith(SUPPORTED_EXTENSIONS):
+                        files_to_process.append(os.path.join(dirpath, f))
+
+        elif os.path.isdir(input_data):
             for f in os.listdir(input_data):
                 full_path = os.path.join(input_data, f)
-                if os.path.isfile(full_path) and f.lower().endswith(
-                    ('.png', '.jpg', '.jpeg', '.pdf', '.docx', '.xlsx', '.xls')
-                ):
+                if os.path.isfile(full_path) and f.lower().endswith(SUPPORTED_EXTENSIONS):
                     files_to_process.append(full_path)
 
         elif os.path.isfile(input_data):
@@ -623,36 +2447,154 @@ def run_pii_extraction(input_data):
 
     elif isinstance(input_data, list):
         for f in input_data:
-            if isinstance(f, str) and os.path.isfile(f):
-                files_to_process.append(f)
+            # unreadable items are skipped, as missing paths are
+            source = as_source(f)
+            if isinstance(source, str):
+                if os.path.isfile(source):
+                    files_to_process.append(source)
+            elif source is not None:
+                files_to_process.append(source)
+
+    return files_to_process
+
+
+def iter_pii_extraction(input_data, workers: Optional[int] = None, stage_metrics: Optional["metrics.StageMetrics"] = None):
+    # Generator version of run_pii_extraction: rows are yielded as soon as
+    # their page is done. A file that fails part-way keeps the rows already
+    # yielded and contributes nothing further.
+    # stage_metrics collects timings/counters; it is re-activated around every
+    # step because a streaming response may resume the generator on another
+    # thread.
+    rows = _iter_pii_extraction(input_data, workers)
+    if stage_metrics is None:
+        yield from rows
+        return
+
+    while True:
+        with metrics.collect(stage_metrics):
+            row = next(rows, None)
+        if row is None:
+            return
+        yield row
+
+
+def _iter_pii_extraction(input_data, workers: Optional[int] = None):
+    files_to_process = collect_files(input_data)
+    workers = _resolve_workers(workers)
+
+    if workers == 1:
+        for file_path in files_to_process:
+            try:
+                file_hash, rows = cached_rows(file_path)
+                if rows is not None:
+                    yield from rows
+                    continue
+
+                # keep a copy for the cache unless the file turns out huge
+                kept = [] if file_hash else None
+                for row in iter_document_rows(file_path, file_hash=file_hash):
+                    if kept is not None:
+                        kept.append(row)
+                        if len(kept) > STREAM_CACHE_MAX_ROWS:
+                            kept = None
+                    yield row
+                if kept is not None:
+                    store_rows(file_hash, kept)
+
+            except ModelUnavailableError:
+                raise
+            except Exception:
+                traceback.print_exc()
+        return
+
+    failed_files = set()
+    for file_idx, rows, error in _iter_parallel_results(files_to_process, workers):
+        if error is not None:
+            failed_files.add(file_idx)
+        elif file_idx not in failed_files:
+            yield from rows
+
+
+def iter_file_results(files_to_process: List[str], workers: Optional[int] = None):
+    # (file_path, rows, error) for each file, in order, as soon as the file is
+    # done. A file contributes rows only if all of its pages succeeded.
+    # Unsupported files are left out.
+    workers = _resolve_workers(workers)
+
+    if workers == 1:
+        for file_path in files_to_process:
+            result = process_document(file_path)
+            if result.get("status") == "success":
+                yield file_path, result.get("rows", []), None
+            elif result.get("status") == "failure":
+                yield file_path, [], result.get("error")
+        return
+
+    # parallel results arrive in file order, so a file is done when the
+    # next one shows up
+    file_hashes = {}
+    current, rows, error = None, [], None
+
+    def finished():
+        if error is None and current in file_hashes:
+            store_rows(file_hashes[current], rows)
+        return files_to_process[current], rows if error is None else [], error
+
+    for file_idx, page_rows, page_error in _iter_parallel_results(files_to_process, workers, file_hashes):
+        if file_idx != current:
+            if current is not None:
+                yield finished()
+            current, rows, error = file_idx, [], None
+        if page_error is not None:
+            error = error or page_error
+        elif error is None:
+            rows.extend(page_rows)
+
+    if current is not None:
+        yield finished()
+
+
+def run_pii_extraction(input_data, workers: Optional[int] = None, metadata: bool = False, profile: bool = False,
+                       columnar: bool = False):
+    # workers: size of the process pool; None reads PII_WORKERS (default 1,
+    # sequential), 0 uses every core.
+    # columnar=True collects "rows" in a ResultTable instead of a list, for
+    # runs too large to hold as dicts (and cheap to send between processes).
+    # metadata=True adds per-stage timings and counters (worker processes
+    # included) under "metadata".
+    # profile=True runs under cProfile and adds the hot-path report (and the
+    # saved .prof artifact's path) under "profile". cProfile only sees its
+    # own process, so a profiled run is always sequential.
+    if profile:
+        with profiling.profiled("extract") as report:
+            result = run_pii_extraction(input_data, 1, metadata, columnar=columnar)
+        result["profile"] = report
+        return result
+
+    started = time.perf_counter()
+    with metrics.collect() as stage_metrics:
+        result = _run_pii_extraction(input_data, workers, columnar)
+    if metadata:
+        result["metadata"] = run_metadata(stage_metrics, started)
+    return result
+
+
+def _run_pii_extraction(input_data, workers: Optional[int] = None, columnar: bool = False):
+    files_to_process = collect_files(input_data)
 
     if not files_to_process:
         return {
             "status": "error",
             "message": "No valid files found",
-            "rows": []
+            "rows": ResultTable() if columnar else []
         }
     # Process files
 
-    all_rows = []
-
-    for file_path in files_to_process:
-        result = process_document(file_path)
-
-        if result.get("status") == "success":
-            all_rows.extend(result.get("rows", []))
+    all_rows = ResultTable() if columnar else []
+    for _, rows, _ in iter_file_results(files_to_process, workers):
+        all_rows.extend(rows)
 
     return {
         "status": "success",
         "rows": all_rows
     }
-
-
-
-
-
-
-
-
-
-
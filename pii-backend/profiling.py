@@ -0,0 +1,73 @@
+# profiling.py
+# Opt-in cProfile capture for a single extraction run, for digging into one
+# pathological document (an address regex that backtracks, a page that
+# splits into hundreds of user blocks, ...).
+#
+# The raw profile is saved as a .prof artifact under PII_PROFILE_DIR (open it
+# with `python -m pstats` or snakeviz); the returned report carries the
+# hottest functions by cumulative and by own time so the caller does not need
+# the file for a first look.
+
+import cProfile
+import os
+import pstats
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List
+
+PROFILE_DIR = os.getenv("PII_PROFILE_DIR", os.path.join(os.getcwd(), "pii_profiles"))
+PROFILE_TOP = 25
+
+
+def _label(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # builtins, e.g. <method 'finditer' of 're.Pattern' objects>
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def hot_paths(stats: pstats.Stats, sort: str, limit: int = PROFILE_TOP) -> List[Dict]:
+    # sort: "cumulative" or "tottime"
+    index = 3 if sort == "cumulative" else 2
+    entries = sorted(stats.stats.items(), key=lambda kv: kv[1][index], reverse=True)[:limit]
+
+    out = []
+    for func, (_, calls, tottime, cumtime, callers) in entries:
+        entry = {
+            "function": _label(func),
+            "calls": calls,
+            "tottime_s": round(tottime, 6),
+            "cumtime_s": round(cumtime, 6),
+        }
+        if callers:
+            # where the time comes from: the caller that spent most in it
+            caller, (_, _, _, caller_cum) = max(callers.items(), key=lambda kv: kv[1][3])
+            entry["top_caller"] = _label(caller)
+            entry["top_caller_cumtime_s"] = round(caller_cum, 6)
+        out.append(entry)
+    return out
+
+
+@contextmanager
+def profiled(name: str = "run", save: bool = True):
+    # Yields a dict that is filled with the report when the block exits.
+    report = {}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield report
+    finally:
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+        report.update({
+            "seconds": round(stats.total_tt, 6),
+            "function_calls": stats.total_calls,
+            "top_cumulative": hot_paths(stats, "cumulative"),
+            "top_self": hot_paths(stats, "tottime"),
+        })
+        if save:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.prof")
+            stats.dump_stats(path)
+            report["artifact"] = path
@@ -0,0 +1,205 @@
+# result_cache.py
+# Content-addressed cache for extraction results. Entries are keyed by the
+# caller (pii_engine uses file hash + engine/config version) and stored in
+# SQLite with their size and last access time; once the cache grows past
+# max_bytes the least recently used entries are evicted.
+#
+# Two kinds are used: "rows" (final rows of one file) and "ocr" (OCR text of
+# one page). Hit/miss counters are kept per kind in the same database so they
+# add up across worker processes.
+#
+# The cache holds extracted PII and raw OCR text in plain SQLite, so it is off
+# unless PII_CACHE_MAX_MB is set, and entries expire PII_CACHE_TTL_HOURS after
+# they were stored. A lookup only reads: access times and counters are kept in
+# memory and written in one transaction every ACCESS_FLUSH_SECONDS, so cache
+# hits do not queue for the write lock behind the workers.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+from typing import Dict, Optional
+
+CACHE_DIR = os.getenv("PII_CACHE_DIR", os.path.join(os.getcwd(), "pii_cache"))
+CACHE_MAX_MB = float(os.getenv("PII_CACHE_MAX_MB", "0"))
+CACHE_TTL_HOURS = float(os.getenv("PII_CACHE_TTL_HOURS", "24"))  # 0: kept until evicted
+ACCESS_FLUSH_SECONDS = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    stored_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# columns added after the first release, for caches created before them
+# (older entries get stored_at 0 and count as expired)
+MIGRATIONS = [
+    ("entries", "stored_at", "REAL NOT NULL DEFAULT 0"),
+]
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.db_path = os.path.join(cache_dir, "results.sqlite3")
+        self.max_bytes = int(CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.ttl_seconds = CACHE_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        os.makedirs(cache_dir, exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.executescript(SCHEMA)
+            for table, column, kind in MIGRATIONS:
+                if column not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+        # not yet written: (kind, key) -> last access, kind -> [hits, misses]
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._accessed = {}
+        self._counts = defaultdict(lambda: [0, 0])
+        self._flushed_at = time.monotonic()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _expiry(self) -> float:
+        # entries stored before this are expired
+        return time.time() - self.ttl_seconds if self.ttl_seconds > 0 else float("-inf")
+
+    def get(self, kind: str, key: str):
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE kind = ? AND key = ? AND stored_at >= ?",
+                (kind, key, self._expiry()),
+            ).fetchone()
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: what is pending belongs to the parent
+                self._pid = os.getpid()
+                self._accessed, self._counts = {}, defaultdict(lambda: [0, 0])
+            if row is not None:
+                self._accessed[(kind, key)] = time.time()
+            self._counts[kind][0 if row is not None else 1] += 1
+            due = time.monotonic() - self._flushed_at >= ACCESS_FLUSH_SECONDS
+        if due:
+            self.flush()
+        return json.loads(row[0]) if row is not None else None
+
+    def flush(self):
+        # writes pending access times and counters in one transaction
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._accessed, self._counts = {}, defaultdict(lambda: [0, 0])
+            accessed, counts = self._accessed, self._counts
+            self._accessed, self._counts = {}, defaultdict(lambda: [0, 0])
+            self._flushed_at = time.monotonic()
+        if not accessed and not counts:
+            return
+
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE kind = ? AND key = ?",
+                [(t, kind, key) for (kind, key), t in accessed.items()],
+            )
+            conn.executemany(
+                "INSERT INTO counters (kind, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT(kind) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(kind, hits, misses) for kind, (hits, misses) in counts.items()],
+            )
+            conn.execute("COMMIT")
+
+    def put(self, kind: str, key: str, value):
+        data = json.dumps(value)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with closing(self.connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, last_access, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, data, len(data), now, now),
+            )
+            conn.execute("DELETE FROM entries WHERE stored_at < ?", (self._expiry(),))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # evict down to 90% so every put near the limit doesn't evict again
+        target = int(self.max_bytes * 0.9)
+        conn.execute("BEGIN IMMEDIATE")
+        for kind, key, size in conn.execute(
+            "SELECT kind, key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+            total -= size
+        conn.execute("COMMIT")
+
+    def stats(self) -> Dict:
+        self.flush()
+        with closing(self.connect()) as conn:
+            counters = {
+                kind: {"hits": hits, "misses": misses}
+                for kind, hits, misses in conn.execute("SELECT kind, hits, misses FROM counters")
+            }
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "counters": counters,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._accessed, self._counts = {}, defaultdict(lambda: [0, 0])
+        with closing(self.connect()) as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM counters")
+
+
+_default_cache = None
+
+
+def get_default_cache() -> Optional[ResultCache]:
+    # None when caching is disabled (PII_CACHE_MAX_MB=0, the default)
+    global _default_cache
+    if CACHE_MAX_MB <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
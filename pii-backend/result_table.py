@@ -0,0 +1,305 @@
+# result_table.py
+# Columnar storage and export of extraction rows.
+#
+# A row is a dict whose PII fields are lists of strings (make_row in
+# pii_engine). Kept as dicts, a million rows cost about 1.4 GB; a
+# ResultTable keeps the same rows in about a sixth of that, column by column:
+#  - file_name / sheet_name are interned: one integer per row
+#  - page_number / occurrence are int32 arrays
+#  - user_name and the PII values are UTF-8 bytes in one buffer per column
+#    with offsets into it (the Arrow layout); a PII field also records where
+#    each row's list starts in its values
+#
+# Exports are produced batch by batch (PII_EXPORT_BATCH_ROWS rows), so an
+# export of any size holds one batch in memory. Parquet and Arrow IPC (stream
+# format) need pyarrow (optional: pip install pyarrow); CSV is always
+# available and writes a list field as a JSON array, empty when there is
+# nothing.
+#
+# flat_row gives the row shape of the JSON API, with lists joined by ", ".
+
+import csv
+import io
+import json
+import os
+from array import array
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+
+LIST_FIELDS = ("phone", "email", "aadhaar", "pan", "address", "dl", "voter_id", "dob")
+COLUMNS = ("file_name", "user_name", "page_number", "sheet_name", "occurrence") + LIST_FIELDS
+
+EXPORT_BATCH_ROWS = int(os.getenv("PII_EXPORT_BATCH_ROWS", "50000"))
+
+# format: (media type, file extension)
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+    "csv": ("text/csv", ".csv"),
+}
+
+
+class ExportUnavailableError(RuntimeError):
+    pass
+
+
+def flat_row(row: Dict) -> Dict:
+    return {k: ", ".join(v) if isinstance(v, list) else v for k, v in row.items()}
+
+
+class _Interned:
+    def __init__(self):
+        self.codes = array("i")
+        self.values = []
+        self._index = {}
+
+    def append(self, value: str):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i: int) -> str:
+        return self.values[self.codes[i]]
+
+    def to_arrow(self, pa, start: int, stop: int):
+        return pa.array(self.values, pa.string()).take(pa.array(np.frombuffer(self.codes, np.int32)[start:stop]))
+
+
+class _Strings:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("q", [0])
+
+    def append(self, value: str):
+        self.data += value.encode()
+        self.offsets.append(len(self.data))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode()
+
+    def to_arrow(self, pa, start: int, stop: int):
+        offsets = np.frombuffer(self.offsets, np.int64)[start:stop + 1]
+        data = self.data[offsets[0]:offsets[-1]]
+        return pa.StringArray.from_buffers(
+            stop - start, pa.py_buffer((offsets - offsets[0]).astype(np.int32)), pa.py_buffer(data)
+        )
+
+
+class _StringLists:
+    def __init__(self):
+        self.values = _Strings()
+        self.offsets = array("I", [0])
+
+    def append(self, items):
+        if isinstance(items, str):
+            # row stored before fields were lists
+            items = [items] if items else []
+        for value in items:
+            self.values.append(value)
+        self.offsets.append(len(self.values))
+
+    def __getitem__(self, i: int) -> list:
+        return [self.values[j] for j in range(self.offsets[i], self.offsets[i + 1])]
+
+    def to_arrow(self, pa, start: int, stop: int):
+        offsets = np.frombuffer(self.offsets, np.uint32)[start:stop + 1].astype(np.int64)
+        values = self.values.to_arrow(pa, int(offsets[0]), int(offsets[-1]))
+        return pa.ListArray.from_arrays(pa.array((offsets - offsets[0]).astype(np.int32)), values)
+
+
+class ResultTable:
+    # Append-only. Iterating yields the rows as dicts again (COLUMNS only).
+
+    def __init__(self, rows: Iterable[Dict] = ()):
+        self.file_name = _Interned()
+        self.user_name = _Strings()
+        self.page_number = array("i")
+        self.sheet_name = _Interned()
+        self.occurrence = array("i")
+        self.fields = {field: _StringLists() for field in LIST_FIELDS}
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return len(self.page_number)
+
+    def append(self, row: Dict):
+        self.file_name.append(row.get("file_name", ""))
+        self.user_name.append(row.get("user_name", ""))
+        self.page_number.append(row.get("page_number", 0))
+        self.sheet_name.append(row.get("sheet_name", ""))
+        self.occurrence.append(row.get("occurrence", 1))
+        for field, column in self.fields.items():
+            column.append(row.get(field, ()))
+
+    def extend(self, rows: Iterable[Dict]):
+        for row in rows:
+            self.append(row)
+
+    def row(self, i: int) -> Dict:
+        row = {
+            "file_name": self.file_name[i],
+            "user_name": self.user_name[i],
+            "page_number": self.page_number[i],
+            "sheet_name": self.sheet_name[i],
+            "occurrence": self.occurrence[i],
+        }
+        for field, column in self.fields.items():
+            row[field] = column[i]
+        return row
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (self.row(i) for i in range(len(self)))
+
+    def to_arrow(self, start: int = 0, stop=None):
+        # rows [start, stop) as a pyarrow.RecordBatch
+        pa = _pyarrow()
+        stop = len(self) if stop is None else stop
+        arrays = [
+            self.file_name.to_arrow(pa, start, stop),
+            self.user_name.to_arrow(pa, start, stop),
+            pa.array(np.frombuffer(self.page_number, np.int32)[start:stop]),
+            self.sheet_name.to_arrow(pa, start, stop),
+            pa.array(np.frombuffer(self.occurrence, np.int32)[start:stop]),
+        ]
+        arrays += [self.fields[field].to_arrow(pa, start, stop) for field in LIST_FIELDS]
+        return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema(pa))
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ExportUnavailableError("Parquet and Arrow export need pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def arrow_schema(pa=None):
+    pa = pa or _pyarrow()
+    return pa.schema(
+        [
+            ("file_name", pa.string()),
+            ("user_name", pa.string()),
+            ("page_number", pa.int32()),
+            ("sheet_name", pa.string()),
+            ("occurrence", pa.int32()),
+        ]
+        + [(field, pa.list_(pa.string())) for field in LIST_FIELDS]
+    )
+
+
+# EXPORT
+
+def check_format(fmt: str):
+    # ValueError for an unknown format, ExportUnavailableError when it needs
+    # pyarrow and pyarrow is missing
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    if fmt != "csv":
+        _pyarrow()
+
+
+def _iter_batches(rows, batch_rows: int):
+    # (table, start, stop) slices; a ResultTable is sliced as it is, other
+    # row iterables are packed into one ResultTable per batch
+    if isinstance(rows, ResultTable):
+        for start in range(0, len(rows), batch_rows):
+            yield rows, start, min(start + batch_rows, len(rows))
+        return
+
+    table = ResultTable()
+    for row in rows:
+        table.append(row)
+        if len(table) >= batch_rows:
+            yield table, 0, len(table)
+            table = ResultTable()
+    if len(table):
+        yield table, 0, len(table)
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands out what was written since the last take().
+    # tell() keeps counting, since Parquet stores absolute offsets.
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_export(rows, fmt: str, batch_rows: int = None) -> Iterator[bytes]:
+    # The exported file piece by piece, one piece per batch of rows.
+    # rows: a ResultTable or any iterable of row dicts.
+    check_format(fmt)
+    batches = _iter_batches(rows, batch_rows or EXPORT_BATCH_ROWS)
+    chunks = _csv_chunks(batches) if fmt == "csv" else _arrow_chunks(batches, fmt)
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+
+
+def write_export(rows, path: str, fmt: str = None, batch_rows: int = None):
+    # fmt defaults to the one matching the file extension
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = next((name for name, (_, e) in EXPORT_FORMATS.items() if e == ext), ext.lstrip("."))
+    check_format(fmt)
+    with open(path, "wb") as f:
+        for chunk in iter_export(rows, fmt, batch_rows):
+            f.write(chunk)
+
+
+def _csv_chunks(batches):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for table, start, stop in batches:
+        for i in range(start, stop):
+            row = table.row(i)
+            writer.writerow([
+                (json.dumps(row[c], ensure_ascii=False) if row[c] else "") if c in LIST_FIELDS else row[c]
+                for c in COLUMNS
+            ])
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue().encode()
+
+
+def _arrow_chunks(batches, fmt: str):
+    pa = _pyarrow()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, arrow_schema(pa))
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(sink, arrow_schema(pa))
+        write = writer.write_batch
+
+    for table, start, stop in batches:
+        write(table.to_arrow(start, stop))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,303 @@
+# scan_cli.py
+# Incremental PII scan of directory trees, for nightly sweeps of shared
+# drives where almost nothing changes between runs.
+#
+#   cd pii-backend
+#   python scan_cli.py /mnt/share/hr /mnt/share/kyc --output kyc.ndjson
+#
+# Folders are walked recursively. A SQLite manifest remembers every file that
+# was scanned: path, size, mtime, SHA-256 and the engine version that read it.
+#  - same size and mtime: skipped without reading the file
+#  - changed size or mtime, same content hash: skipped after hashing
+#  - anything else, or a newer engine version: extracted again
+# Rows are appended to the NDJSON output one finished file at a time, each
+# with the file_path, sha256 and scanned_at of the scan that produced it. When
+# a file that had rows is scanned again or has disappeared from a scanned
+# folder, the output is compacted at the end of the run: rows not from a
+# file's latest scan are dropped (a copy is written and swapped in, so a crash
+# leaves the old output). The manifest records how much of the output is complete,
+# so an interrupted sweep run again with the same output resumes after the
+# last finished file. Files that failed are not retried until they change
+# (or with --retry-failed). --full rescans everything into a fresh output; an
+# existing output the manifest has never written to is left alone unless
+# --force is given.
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+
+import pii_engine
+from result_cache import file_sha256
+from result_table import flat_row
+
+SCAN_MANIFEST = os.getenv("PII_SCAN_MANIFEST", os.path.join(os.getcwd(), "pii_scan.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    engine_version TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    committed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stale_outputs (
+    path TEXT PRIMARY KEY
+);
+"""
+
+# file status: done | failed
+# outputs.committed: bytes of the output file that belong to finished files
+# stale_outputs: outputs holding rows of older scans, until compacted
+
+
+class Manifest:
+    def __init__(self, db_path: str = SCAN_MANIFEST):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, path: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+
+    def touch(self, path: str, size: int, mtime_ns: int):
+        # content unchanged: remember the new stat so the next run skips it cheaply
+        self.conn.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, path))
+
+    def forget(self, paths: List[str]):
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def under(self, root: str) -> List[str]:
+        # paths recorded for root (a file) or anywhere below it (a folder)
+        prefix = os.path.join(root, "")
+        rows = self.conn.execute(
+            "SELECT path FROM files WHERE path = ? OR substr(path, 1, ?) = ?", (root, len(prefix), prefix)
+        )
+        return [row["path"] for row in rows]
+
+    def mark_stale(self, output: str, stale: bool = True):
+        if stale:
+            self.conn.execute("INSERT OR IGNORE INTO stale_outputs (path) VALUES (?)", (output,))
+        else:
+            self.conn.execute("DELETE FROM stale_outputs WHERE path = ?", (output,))
+
+    def is_stale(self, output: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM stale_outputs WHERE path = ?", (output,)).fetchone() is not None
+
+    def committed(self, output: str) -> Optional[int]:
+        # None: this manifest has never written to the output
+        row = self.conn.execute("SELECT committed FROM outputs WHERE path = ?", (output,)).fetchone()
+        return row["committed"] if row else None
+
+    def set_committed(self, output: str, committed: int):
+        self.conn.execute("INSERT OR REPLACE INTO outputs (path, committed) VALUES (?, ?)", (output, committed))
+
+    def record(self, entry: Dict, output: Optional[str] = None, committed: Optional[int] = None):
+        # one transaction: the file is only "done" together with its rows
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, engine_version, status, rows, error, scanned_at) "
+            "VALUES (:path, :size, :mtime_ns, :sha256, :engine_version, :status, :rows, :error, :scanned_at)",
+            entry,
+        )
+        if output is not None:
+            self.conn.execute("INSERT OR REPLACE INTO outputs (path, committed) VALUES (?, ?)", (output, committed))
+        self.conn.execute("COMMIT")
+
+
+def plan_scan(manifest: Manifest, roots: List[str], engine_version: str, retry_failed: bool = False, full: bool = False):
+    # (files to extract with their stat and hash, number of files skipped,
+    # manifest paths under the roots that no longer exist)
+    todo, skipped, seen = [], 0, set()
+    for root in roots:
+        for path in pii_engine.collect_files(root, recursive=True):
+            path = os.path.abspath(path)
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            previous = manifest.get(path)
+            known = None if full else previous
+            reusable = (
+                known is not None
+                and known["engine_version"] == engine_version
+                and (known["status"] == "done" or not retry_failed)
+            )
+            if reusable and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+                skipped += 1
+                continue
+
+            try:
+                sha256 = file_sha256(path)
+            except OSError:
+                continue
+            if reusable and known["sha256"] == sha256:
+                manifest.touch(path, st.st_size, st.st_mtime_ns)
+                skipped += 1
+                continue
+
+            todo.append({
+                "path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256,
+                # the output holds rows of an earlier scan of this file
+                "replaces_rows": bool(previous and previous["status"] == "done" and previous["rows"]),
+            })
+
+    gone = [
+        path
+        for root in roots
+        for path in manifest.under(os.path.abspath(root))
+        if path not in seen and not os.path.exists(path)
+    ]
+    return todo, skipped, gone
+
+
+class OutputConflictError(RuntimeError):
+    pass
+
+
+def open_output(manifest: Manifest, output: str, fresh: bool = False, force: bool = False):
+    # Appends after the committed part; anything past it is a file that was
+    # being written when the last run stopped, and it will be redone.
+    # fresh (--full): start the output over, every file is written again.
+    committed = manifest.committed(output)
+    if committed is None and not force and os.path.exists(output) and os.path.getsize(output):
+        raise OutputConflictError(
+            f"{output} is not empty and was not written with this manifest; "
+            "pick another --output or pass --force to overwrite it"
+        )
+    if fresh or committed is None:
+        committed = 0
+        manifest.set_committed(output, committed)
+        manifest.mark_stale(output, False)
+    f = open(output, "ab")
+    if f.tell() > committed:
+        f.truncate(committed)
+        f.seek(committed)
+    return f
+
+
+def compact_output(manifest: Manifest, output: str) -> int:
+    # Keeps the rows of each file's latest scan (matching scanned_at) and
+    # drops the rest; returns the number of rows dropped. Rows written before
+    # scanned_at was recorded are kept as long as their file is done.
+    committed = manifest.committed(output) or 0
+    latest, dropped = {}, 0
+    tmp = output + ".compact"
+    with open(output, "rb") as src, open(tmp, "wb") as dst:
+        while src.tell() < committed:
+            line = src.readline()
+            if not line:
+                break
+            row = json.loads(line)
+            path = row.get("file_path")
+            if path not in latest:
+                entry = manifest.get(path)
+                latest[path] = entry["scanned_at"] if entry is not None and entry["status"] == "done" else None
+            if latest[path] is not None and row.get("scanned_at", latest[path]) == latest[path]:
+                dst.write(line)
+            else:
+                dropped += 1
+        dst.flush()
+        os.fsync(dst.fileno())
+        size = dst.tell()
+    os.replace(tmp, output)
+    manifest.set_committed(output, size)
+    manifest.mark_stale(output, False)
+    return dropped
+
+
+def scan(roots: List[str], output: str, manifest_path: str = SCAN_MANIFEST, workers: Optional[int] = None,
+         retry_failed: bool = False, full: bool = False, force: bool = False, log=sys.stderr) -> Dict:
+    started = time.perf_counter()
+    engine_version = pii_engine.extraction_version()
+    output = os.path.abspath(output)
+
+    with closing(Manifest(manifest_path)) as manifest:
+        with open_output(manifest, output, full, force) as out:
+            todo, skipped, gone = plan_scan(manifest, roots, engine_version, retry_failed, full)
+            summary = {"files": len(todo) + skipped, "skipped": skipped, "scanned": 0, "failed": 0, "rows": 0,
+                       "removed": len(gone), "stale_rows": 0}
+            by_path = {entry["path"]: entry for entry in todo}
+            # with --full the output starts empty, so there is nothing old to
+            # drop. Marked before any row is written: a run that stops early
+            # still gets compacted by the next one.
+            if not full and (any(entry["replaces_rows"] for entry in todo)
+                             or any(manifest.get(path)["rows"] for path in gone)):
+                manifest.mark_stale(output)
+
+            results = pii_engine.iter_file_results([entry["path"] for entry in todo], workers)
+            for done, (path, rows, error) in enumerate(results, start=1):
+                entry = dict(by_path[path], engine_version=engine_version, rows=len(rows),
+                             error=error, scanned_at=time.time())
+                if error is not None:
+                    manifest.record(dict(entry, status="failed"))
+                    summary["failed"] += 1
+                    print(f"[{done}/{len(todo)}] {path}: failed: {error}", file=log)
+                    continue
+
+                if rows:
+                    scan_fields = {"file_path": path, "sha256": entry["sha256"], "scanned_at": entry["scanned_at"]}
+                    out.write("".join(json.dumps(dict(flat_row(row), **scan_fields)) + "\n" for row in rows).encode())
+                    out.flush()
+                    os.fsync(out.fileno())
+                manifest.record(dict(entry, status="done"), output, out.tell())
+                summary["scanned"] += 1
+                summary["rows"] += len(rows)
+                print(f"[{done}/{len(todo)}] {path}: {len(rows)} rows", file=log)
+
+        manifest.forget(gone)
+        if manifest.is_stale(output):
+            summary["stale_rows"] = compact_output(manifest, output)
+
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan folders for PII, skipping files unchanged since the last run")
+    parser.add_argument("roots", nargs="+", help="folders (walked recursively) or files")
+    parser.add_argument("--output", required=True, help="NDJSON file rows are appended to")
+    parser.add_argument("--manifest", default=SCAN_MANIFEST, help="SQLite manifest of scanned files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default PII_WORKERS, 0 = all cores)")
+    parser.add_argument("--retry-failed", action="store_true", help="retry files that failed and have not changed since")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and scan every file into a fresh output")
+    parser.add_argument("--force", action="store_true", help="overwrite an output this manifest did not write")
+    args = parser.parse_args(argv)
+
+    missing = [root for root in args.roots if not os.path.exists(root)]
+    if missing:
+        print(f"not found: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    try:
+        summary = scan(args.roots, args.output, args.manifest, args.workers, args.retry_failed, args.full, args.force)
+    except OutputConflictError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
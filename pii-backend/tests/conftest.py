@@ -0,0 +1,24 @@
+# Shared setup for the tests. Run from pii-backend/: python -m pytest tests
+#
+# Tests run on a blank spaCy pipeline, so no model download is needed (names
+# are not found, the regex fields are); set PII_SPACY_MODEL to test with a
+# real model. The result cache is off unless a test turns it on.
+
+import os
+import sys
+
+os.environ.setdefault("PII_SPACY_MODEL", "blank:en")
+os.environ.setdefault("PII_CACHE_MAX_MB", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.corpus import generate
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory):
+    # small synthetic corpus without OCR work: a text PDF, DOCX forms, an XLSX
+    out = tmp_path_factory.mktemp("corpus")
+    generate(str(out), seed=0, pdf_pages=4, scanned_pages=0, cards=0, docx_files=2, docx_people=5, xlsx_rows=300)
+    return out
@@ -0,0 +1,46 @@
+# /extract and /extract/stream through FastAPI's TestClient.
+
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+import result_cache
+from app import app
+
+client = TestClient(app)
+
+
+def upload(path):
+    return {"files": (path.name, path.read_bytes())}
+
+
+def test_stream_returns_docx_rows(corpus, tmp_path, monkeypatch):
+    # The stream runs on Starlette's thread pool, off the main thread, where
+    # building a cache key must not touch the OCR backend.
+    monkeypatch.setattr(result_cache, "CACHE_MAX_MB", 64)
+    monkeypatch.setattr(result_cache, "_default_cache", result_cache.ResultCache(str(tmp_path)))
+    path = corpus / "form_0.docx"
+    streamed = client.post("/extract/stream", files=upload(path))
+    assert streamed.status_code == 200
+    rows = [json.loads(line) for line in streamed.text.splitlines()]
+
+    extracted = client.post("/extract", files=upload(path))
+    assert extracted.status_code == 200
+    assert rows
+    assert rows == extracted.json()["rows"]
+
+
+def test_extract_survives_a_dead_worker(corpus):
+    # a worker that exits breaks the process pool; the next request gets a new one
+    if app_module.EXECUTOR_KIND != "process":
+        pytest.skip("PII_EXECUTOR is not process")
+    with pytest.raises(BrokenProcessPool):
+        app_module.get_executor().submit(os._exit, 1).result()
+
+    response = client.post("/extract", files=upload(corpus / "form_0.docx"))
+    assert response.status_code == 200
+    assert response.json()["rows"]
@@ -0,0 +1,108 @@
+# DOCX chunking (iter_docx_chunks) on small hand-written documents.
+# Run from pii-backend/: python -m pytest tests
+
+import io
+import zipfile
+
+from pii_engine import InMemoryFile, iter_docx_chunks
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC_NS = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+
+
+def p(*runs):
+    return "<w:p>" + "".join(f"<w:r>{r}</w:r>" for r in runs) + "</w:p>"
+
+
+def t(text):
+    return f"<w:t>{text}</w:t>"
+
+
+PAGE_BREAK = '<w:br w:type="page"/>'
+
+
+def table(*rows):
+    return "<w:tbl>" + "".join(
+        "<w:tr>" + "".join(f"<w:tc>{cell if cell.startswith('<') else p(t(cell))}</w:tc>" for cell in row) + "</w:tr>"
+        for row in rows
+    ) + "</w:tbl>"
+
+
+def docx(body, parts=None):
+    # parts: extra zip members, e.g. {"word/header1.xml": "<w:p>...</w:p>"}
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as zf:
+        zf.writestr(
+            "word/document.xml",
+            f'<w:document xmlns:w="{W_NS}" xmlns:mc="{MC_NS}"><w:body>{body}<w:sectPr/></w:body></w:document>',
+        )
+        for name, xml in (parts or {}).items():
+            root = "hdr" if "header" in name else "ftr"
+            zf.writestr(name, f'<w:{root} xmlns:w="{W_NS}">{xml}</w:{root}>')
+    return InMemoryFile("test.docx", out.getvalue())
+
+
+def chunks(body, parts=None):
+    return list(iter_docx_chunks(docx(body, parts)))
+
+
+def test_page_break_splits_chunks():
+    assert chunks(p(t("Ravi Kumar"), PAGE_BREAK, t("PAN ABCDE1234F")) + p(t("next"))) == [
+        "Ravi Kumar",
+        "PAN ABCDE1234F\nnext",
+    ]
+
+
+def test_section_break_splits_chunks():
+    body = f"<w:p><w:pPr><w:sectPr/></w:pPr><w:r>{t('first section')}</w:r></w:p>" + p(t("second section"))
+    assert chunks(body) == ["first section", "second section"]
+
+
+def test_record_table_rows_are_chunks():
+    body = p(t("Register")) + table(
+        ["Customer Name", "PAN", "Mobile"],
+        ["Sita Sharma", "BCDEF2345G", "9876543210"],
+        ["Arjun Mehta", "CDEFG3456H", ""],
+    )
+    assert chunks(body) == [
+        "Register",
+        "Customer Name: Sita Sharma\nPAN: BCDEF2345G\nMobile: 9876543210",
+        "Customer Name: Arjun Mehta\nPAN: CDEFG3456H",
+    ]
+
+
+def test_form_table_is_body_text():
+    body = table(["Name:", "Priya Rao"], ["PAN", "DEFGH4567J"], ["a", "b", "c"]) + p(t("end"))
+    assert chunks(body) == ["Name: Priya Rao\nPAN: DEFGH4567J\na\tb\tc\nend"]
+
+
+def test_nested_table_goes_into_its_cell():
+    inner = table(["Voter", "ABC1234567"])
+    body = table(["Name", "Priya Rao"], ["IDs", p(t("PAN DEFGH4567J")) + inner])
+    assert chunks(body) == ["Name: Priya Rao\nIDs: PAN DEFGH4567J Voter: ABC1234567"]
+
+
+def test_text_box_fallback_is_read_once():
+    box = (
+        "<mc:AlternateContent><mc:Choice>"
+        f"<w:drawing><w:txbxContent>{p(t('Email ravi@example.com'))}</w:txbxContent></w:drawing>"
+        "</mc:Choice><mc:Fallback>"
+        f"<w:pict><w:txbxContent>{p(t('Email ravi@example.com'))}</w:txbxContent></w:pict>"
+        "</mc:Fallback></mc:AlternateContent>"
+    )
+    # the text box paragraph ends before the one holding it
+    assert chunks(p(t("Ravi Kumar"), box)) == ["Email ravi@example.com\nRavi Kumar"]
+
+
+def test_header_and_footer_join_first_body_chunk():
+    parts = {
+        "word/header1.xml": p(t("ACME Bank")),
+        "word/header2.xml": p(t("ACME Bank")),
+        "word/footer1.xml": p(t("Confidential")),
+    }
+    body = p(t("Ravi Kumar"), PAGE_BREAK, t("page two"))
+    assert chunks(body, parts) == ["Ravi Kumar\nACME Bank\nConfidential", "page two"]
+
+
+def test_header_only_document():
+    assert chunks("", {"word/footer1.xml": p(t("Confidential"))}) == ["Confidential"]
@@ -0,0 +1,27 @@
+# run_pii_extraction: worker pool and Excel engines give the same rows.
+
+import pii_engine
+
+
+def corpus_files(corpus):
+    return sorted(str(p) for p in corpus.iterdir() if p.suffix != ".json")
+
+
+def test_parallel_matches_sequential(corpus):
+    files = corpus_files(corpus)
+    sequential = pii_engine.run_pii_extraction(files, workers=1)
+    parallel = pii_engine.run_pii_extraction(files, workers=2)
+    assert sequential["status"] == parallel["status"] == "success"
+    assert sequential["rows"]
+    # same rows in the same order
+    assert parallel["rows"] == sequential["rows"]
+
+
+def test_columnar_excel_matches_row_by_row(corpus, monkeypatch):
+    path = str(corpus / "customers.xlsx")
+    monkeypatch.setattr(pii_engine, "EXCEL_ENGINE", "columnar")
+    columnar = pii_engine.run_pii_extraction(path)["rows"]
+    monkeypatch.setattr(pii_engine, "EXCEL_ENGINE", "rows")
+    row_by_row = pii_engine.run_pii_extraction(path)["rows"]
+    assert len(columnar) == 300
+    assert columnar == row_by_row
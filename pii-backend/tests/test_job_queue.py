@@ -0,0 +1,56 @@
+# Job queue leases and worker restarts.
+
+import time
+
+import job_queue
+
+
+def wait_for(condition, seconds=30):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_expired_lease_is_taken_over(corpus, tmp_path, monkeypatch):
+    store = job_queue.JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit([str(corpus / "form_0.docx")], str(tmp_path))
+
+    assert store.claim("a") == job_id
+    assert store.claim("b") is None
+    assert store.renew(job_id, "a")
+
+    # worker "a" stops renewing
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", -1)
+    assert store.renew(job_id, "a")
+    assert store.claim("b") == job_id
+    assert not store.renew(job_id, "a")
+    assert not store.finish_job(job_id, worker="a")
+    assert store.finish_job(job_id, worker="b")
+
+
+def test_dead_worker_is_restarted_and_its_job_finished(corpus, tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "SUPERVISE_SECONDS", 0.2)
+    monkeypatch.setattr(job_queue, "POLL_SECONDS", 0.1)
+    store = job_queue.JobStore(str(tmp_path / "jobs.sqlite3"))
+    # claimed by a worker that died before renewing its lease
+    orphan = store.submit([str(corpus / "form_0.docx")], str(tmp_path / "orphan"))
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 0.5)
+    assert store.claim("dead") == orphan
+
+    processes, stop_event = job_queue.start_workers(store.db_path, count=1)
+    try:
+        first = processes[0]
+        assert wait_for(lambda: store.status(orphan)["status"] == "done")
+
+        first.kill()
+        assert wait_for(lambda: processes[0] is not first and processes[0].is_alive())
+        job_id = store.submit([str(corpus / "form_1.docx")], str(tmp_path / "next"))
+        assert wait_for(lambda: store.status(job_id)["status"] == "done")
+        assert store.status(job_id)["progress"]["rows"] > 0
+    finally:
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=10)
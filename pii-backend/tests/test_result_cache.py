@@ -0,0 +1,30 @@
+# Result cache expiry and deferred access bookkeeping.
+
+import sqlite3
+import time
+
+from result_cache import ResultCache
+
+
+def test_entries_expire(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20, ttl_seconds=0.2)
+    cache.put("rows", "a", [{"pan": ["ABCDE1234F"]}])
+    assert cache.get("rows", "a") == [{"pan": ["ABCDE1234F"]}]
+    time.sleep(0.3)
+    assert cache.get("rows", "a") is None
+    cache.put("rows", "b", [])
+    # expired entries are deleted on the next put
+    assert cache.stats()["entries"] == 1
+
+
+def test_lookups_do_not_write(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20)
+    cache.put("ocr", "page", "text")
+    for _ in range(3):
+        assert cache.get("ocr", "page") == "text"
+    assert cache.get("ocr", "other") is None
+
+    conn = sqlite3.connect(cache.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM counters").fetchone()[0] == 0
+    conn.close()
+    assert cache.stats()["counters"] == {"ocr": {"hits": 3, "misses": 1}}
@@ -0,0 +1,68 @@
+# ResultTable and the CSV / Parquet / Arrow exports, read back.
+
+import csv
+import io
+import json
+
+import pytest
+
+from result_table import COLUMNS, LIST_FIELDS, ResultTable, iter_export, write_export
+
+
+def make_rows():
+    rows = []
+    for i in range(5):
+        row = {
+            "file_name": f"batch_{i % 2}.xlsx",
+            "user_name": ["Ravi Kumar", "", "Sita Devi", "José Álvarez", "Priya Rao"][i],
+            "page_number": i + 1,
+            "sheet_name": "Customers" if i % 2 else "",
+            "occurrence": 1 + i % 3,
+        }
+        for field in LIST_FIELDS:
+            row[field] = []
+        row["pan"] = [f"ABCDE123{i}F"]
+        # commas inside a value, and more than one value
+        row["address"] = ["12, MG Road, Bengaluru 560001"] if i % 2 == 0 else []
+        row["phone"] = ["9876543210", "9123456780"] if i == 3 else []
+        rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize("as_table", [True, False])
+def test_csv_round_trip(as_table):
+    rows = make_rows()
+    source = ResultTable(rows) if as_table else iter(rows)
+    data = b"".join(iter_export(source, "csv", batch_rows=2)).decode()
+
+    read = list(csv.DictReader(io.StringIO(data)))
+    assert list(read[0]) == list(COLUMNS)
+    for row in read:
+        for field in LIST_FIELDS:
+            row[field] = json.loads(row[field]) if row[field] else []
+        row["page_number"] = int(row["page_number"])
+        row["occurrence"] = int(row["occurrence"])
+    assert read == rows
+
+
+def test_table_gives_rows_back():
+    rows = make_rows()
+    assert list(ResultTable(rows)) == rows
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_arrow_formats_round_trip(fmt, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    rows = make_rows()
+    path = tmp_path / f"rows.{fmt}"
+    write_export(ResultTable(rows), str(path), fmt, batch_rows=2)
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+    else:
+        with pa.ipc.open_stream(pa.OSFile(str(path))) as reader:
+            table = reader.read_all()
+    assert table.column_names == list(COLUMNS)
+    assert table.to_pylist() == rows
@@ -0,0 +1,96 @@
+# Incremental scans (scan_cli.scan) over a copy of the test corpus.
+
+import json
+import os
+import random
+import shutil
+
+import pytest
+
+import scan_cli
+from benchmarks.corpus import write_docx
+
+
+@pytest.fixture
+def tree(corpus, tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for name in ("form_0.docx", "form_1.docx", "narrative.pdf"):
+        shutil.copy(corpus / name, src / name)
+    return src
+
+
+def run(tree, tmp_path, **kwargs):
+    return scan_cli.scan([str(tree)], str(tmp_path / "out.ndjson"), str(tmp_path / "manifest.sqlite3"),
+                         workers=1, log=open(os.devnull, "w"), **kwargs)
+
+
+def output_rows(tmp_path):
+    with open(tmp_path / "out.ndjson") as f:
+        return [json.loads(line) for line in f]
+
+
+def rows_per_file(tmp_path):
+    counts = {}
+    for row in output_rows(tmp_path):
+        name = os.path.basename(row["file_path"])
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def test_changed_and_deleted_files_leave_no_stale_rows(tree, tmp_path):
+    run(tree, tmp_path)
+    before = rows_per_file(tmp_path)
+
+    write_docx(str(tree / "form_0.docx"), random.Random(1), 3)
+    os.remove(tree / "narrative.pdf")
+    summary = run(tree, tmp_path)
+
+    assert summary["scanned"] == 1 and summary["removed"] == 1
+    assert summary["stale_rows"] == before["form_0.docx"] + before["narrative.pdf"]
+    after = rows_per_file(tmp_path)
+    assert after == {"form_0.docx": summary["rows"], "form_1.docx": before["form_1.docx"]}
+    # every row names the scan it came from
+    manifest = scan_cli.Manifest(str(tmp_path / "manifest.sqlite3"))
+    for row in output_rows(tmp_path):
+        entry = manifest.get(row["file_path"])
+        assert (row["sha256"], row["scanned_at"]) == (entry["sha256"], entry["scanned_at"])
+    manifest.close()
+
+
+def test_unchanged_files_are_skipped(tree, tmp_path):
+    first = run(tree, tmp_path)
+    assert first["scanned"] == 3
+    rows = output_rows(tmp_path)
+
+    assert run(tree, tmp_path)["skipped"] == 3
+    # new mtime, same content: skipped after hashing
+    os.utime(tree / "form_1.docx", ns=(1, 1))
+    again = run(tree, tmp_path)
+    assert (again["skipped"], again["scanned"]) == (3, 0)
+    assert output_rows(tmp_path) == rows
+
+
+def test_interrupted_scan_resumes(tree, tmp_path, monkeypatch):
+    real = scan_cli.pii_engine.iter_file_results
+
+    def one_file_then_crash(paths, workers=None):
+        results = real(paths, workers)
+        yield next(results)
+        # half of a row of the next file made it to disk
+        with open(tmp_path / "out.ndjson", "a") as f:
+            f.write('{"file_name": "form_')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(scan_cli.pii_engine, "iter_file_results", one_file_then_crash)
+    with pytest.raises(KeyboardInterrupt):
+        run(tree, tmp_path)
+    monkeypatch.setattr(scan_cli.pii_engine, "iter_file_results", real)
+
+    resumed = run(tree, tmp_path)
+    assert (resumed["skipped"], resumed["scanned"]) == (1, 2)
+
+    fresh = tmp_path / "fresh"
+    fresh.mkdir()
+    run(tree, fresh)
+    assert rows_per_file(tmp_path) == rows_per_file(fresh)